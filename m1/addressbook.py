@@ -16,7 +16,11 @@ Methods:
    __str__
    __repr__
    __eq__
+   __hash__
 """
+# The fields of an entry in constructor order, the other modules use these names
+FIELDS = ("first_name", "last_name", "birthday", "email", "street_address", "city", "state", "zip", "phone")
+
 class AddressBook(): # Defining the book class
     def __init__(self, first_name, last_name, birthday, email, street_address, city, state, zip, phone):
         self.first_name = first_name
@@ -45,17 +49,22 @@ class AddressBook(): # Defining the book class
                 self.state == value.state and
                 self.zip == value.zip and
                 self.phone == value.phone)
-    
-person1 = AddressBook("John", "Doe", "01/01/1990", "john.doe@example.com", "123 Main St", "Anytown", 
-                      "NY", 12345, "555-555-5555")
-person2 = AddressBook("Jane", "Smith", "02/02/1985", "jane.smith@example.com", "456 Elm St", "Othertown", 
-                      "CA", 67890, "555-555-1234")
-person3 = AddressBook("Emily", "Johnson", "03/03/1975", "emily.johnson@example.com", "789 Oak St", "Sometown", 
-                      "TX", 11111, "555-555-6789")
-person4 = AddressBook("Michael", "Brown", "04/04/1965", "michael.brown@example.com", "101 Pine St", "Anycity", 
-                      "FL", 22222, "555-555-2468")
 
-print(str(person1))
-print(str(person2))
-print(str(person3))
-print(str(person4))
\ No newline at end of file
+    def __hash__(self): # Hashes the same fields __eq__ compares
+        return hash((self.first_name, self.last_name, self.birthday, self.email, self.street_address,
+                     self.city, self.state, self.zip, self.phone))
+
+if __name__ == "__main__":
+    person1 = AddressBook("John", "Doe", "01/01/1990", "john.doe@example.com", "123 Main St", "Anytown", 
+                          "NY", 12345, "555-555-5555")
+    person2 = AddressBook("Jane", "Smith", "02/02/1985", "jane.smith@example.com", "456 Elm St", "Othertown", 
+                          "CA", 67890, "555-555-1234")
+    person3 = AddressBook("Emily", "Johnson", "03/03/1975", "emily.johnson@example.com", "789 Oak St", "Sometown", 
+                          "TX", 11111, "555-555-6789")
+    person4 = AddressBook("Michael", "Brown", "04/04/1965", "michael.brown@example.com", "101 Pine St", "Anycity", 
+                          "FL", 22222, "555-555-2468")
+
+    print(str(person1))
+    print(str(person2))
+    print(str(person3))
+    print(str(person4))
\ No newline at end of file
@@ -0,0 +1,122 @@
+"""
+Compact column store for address book entries.
+
+Every field is kept in its own column instead of one __dict__ per entry.
+city, state and zip repeat a lot, so they are interned and all rows share
+one string. zip stays as it was given, so leading zeros and ZIP+4 values
+like "02134-1234" come back unchanged.
+
+Classes:
+   AddressBookStore -- the columns
+   AddressBookRow -- a light view of one row that acts like an AddressBook
+
+Run this file to compare memory use against the AddressBook class.
+"""
+import sys
+import tracemalloc
+
+from addressbook import FIELDS, AddressBook
+
+INTERNED = ("city", "state", "zip")
+
+
+class AddressBookStore():
+    """
+    Holds address book entries in columns.
+
+    Methods:
+    append: Adds an entry and returns its row
+    __getitem__: Returns a row view by position
+    __len__ / __iter__: Number of rows / iterate the rows
+    """
+    def __init__(self):
+        self.columns = {field: [] for field in FIELDS}
+
+    def append(self, first_name, last_name, birthday, email, street_address, city, state, zip, phone):
+        values = locals()
+        for field in FIELDS:
+            self.columns[field].append(self._pack(field, values[field]))
+        return AddressBookRow(self, len(self) - 1)
+
+    def _pack(self, field, value):
+        # Only strings can be interned, a zip given as a number is kept as one
+        if field in INTERNED and isinstance(value, str):
+            return sys.intern(value)
+        return value
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("row out of range")
+        return AddressBookRow(self, index)
+
+    def __len__(self):
+        return len(self.columns["phone"])
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield AddressBookRow(self, index)
+
+
+class AddressBookRow():
+    """
+    A view of one row in an AddressBookStore. It has the same attributes
+    and __str__, __repr__, __eq__ and __hash__ as AddressBook, and setting an
+    attribute writes into the store.
+    """
+    __slots__ = ("_store", "_index")
+
+    def __init__(self, store, index):
+        self._store = store
+        self._index = index
+
+    # The AddressBook methods only read attributes, so the row can share them
+    __str__ = AddressBook.__str__
+    __repr__ = AddressBook.__repr__
+    __eq__ = AddressBook.__eq__
+    __hash__ = AddressBook.__hash__
+
+
+def _column(field):
+    def get(self):
+        return self._store.columns[field][self._index]
+
+    def set(self, value):
+        self._store.columns[field][self._index] = self._store._pack(field, value)
+    return property(get, set)
+
+for _field in FIELDS:
+    setattr(AddressBookRow, _field, _column(_field))
+
+
+def benchmark(count=100000):
+    # Builds the same entries both ways and compares the traced memory
+    cities = ["Anytown", "Othertown", "Sometown", "Anycity"]
+    states = ["NY", "CA", "TX", "FL"]
+
+    def rows():
+        # join copies city and state, so every row gets its own string like rows read from a file
+        for i in range(count):
+            yield (f"First{i}", f"Last{i}", "01/01/1990", f"user{i}@example.com", f"{i} Main St",
+                   "".join(cities[i % 4]), "".join(states[i % 4]), f"{i % 100000:05d}", f"555-{i:07d}")
+
+    tracemalloc.start()
+    objects = [AddressBook(*row) for row in rows()]
+    object_size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    tracemalloc.start()
+    store = AddressBookStore()
+    for row in rows():
+        store.append(*row)
+    store_size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    assert store[count - 1] == objects[count - 1]
+    print(f"{count} entries")
+    print(f"AddressBook objects: {object_size / 1024 / 1024:.1f} MB ({object_size / count:.0f} bytes each)")
+    print(f"AddressBookStore:    {store_size / 1024 / 1024:.1f} MB ({store_size / count:.0f} bytes each)")
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,113 @@
+"""
+Duplicate detection for address book imports.
+
+Every record gets a canonical form (trimmed, lower case names and email,
+phone reduced to its digits) and a hash of that form, so exact duplicates
+are found in one pass with a dict instead of comparing every pair.
+
+Records that are not exact duplicates but share an email or a phone number
+are reported as near duplicates. Those keys are used as blocks: only
+records in the same block are ever grouped together.
+
+Records can be AddressBook objects, AddressBookRow views or dicts with the
+same field names.
+
+Functions:
+   canonical -- the normalized field values of a record
+   record_hash -- a stable hash of the canonical form
+   find_duplicates -- exact and near duplicates in a list of records
+
+Run this file to time it on a synthetic import.
+"""
+import hashlib
+import random
+import re
+import sys
+import time
+
+from addressbook import FIELDS
+
+EMAIL = FIELDS.index("email")
+PHONE = FIELDS.index("phone")
+NOT_DIGIT = re.compile(r"\D")
+
+
+def fields(record):
+    if isinstance(record, dict):
+        values = [record.get(name) for name in FIELDS]
+    else:
+        values = [getattr(record, name, None) for name in FIELDS]
+    return ["" if value is None else str(value) for value in values]
+
+def normalize_phone(phone):
+    digits = NOT_DIGIT.sub("", phone)
+    # Drop the US country code so 1-555-... and 555-... match
+    if len(digits) == 11 and digits.startswith("1"):
+        digits = digits[1:]
+    return digits
+
+def canonical(record):
+    values = [" ".join(value.lower().split()) for value in fields(record)]
+    values[PHONE] = normalize_phone(values[PHONE])
+    return tuple(values)
+
+def record_hash(record, values=None):
+    # blake2b stays the same between runs, unlike hash() on strings
+    values = values or canonical(record)
+    return hashlib.blake2b("\x1f".join(values).encode(), digest_size=16).digest()
+
+def find_duplicates(records):
+    """
+    Returns (exact, near).
+
+    exact -- (first index, duplicate index) for every record that repeats an earlier one
+    near -- (key, [indexes]) for every email or phone shared by more than one distinct record
+    """
+    first_seen = {}
+    exact = []
+    blocks = {}
+    for index, record in enumerate(records):
+        values = canonical(record)
+        digest = record_hash(record, values)
+        if digest in first_seen:
+            exact.append((first_seen[digest], index))
+            continue
+        first_seen[digest] = index
+
+        email, phone = values[EMAIL], values[PHONE]
+        if email:
+            blocks.setdefault("email:" + email, []).append(index)
+        if phone:
+            blocks.setdefault("phone:" + phone, []).append(index)
+
+    near = [(key, indexes) for key, indexes in blocks.items() if len(indexes) > 1]
+    return exact, near
+
+
+def benchmark(count=1000000):
+    rng = random.Random(42)
+    records = []
+    for i in range(count):
+        roll = rng.random()
+        if records and roll < 0.05:
+            # Same person typed again with different case and spacing
+            copy = dict(rng.choice(records))
+            copy["first_name"] = " " + copy["first_name"].upper()
+            records.append(copy)
+        elif records and roll < 0.08:
+            # Different person sharing an email
+            copy = dict(rng.choice(records))
+            copy["first_name"] = f"Other{i}"
+            records.append(copy)
+        else:
+            records.append({"first_name": f"First{i}", "last_name": f"Last{i % 1000}", "birthday": "01/01/1990",
+                            "email": f"user{i}@example.com", "street_address": f"{i} Main St", "city": "Anytown",
+                            "state": "NY", "zip": 10000 + i % 90000, "phone": f"555-{i:07d}"})
+    start = time.perf_counter()
+    exact, near = find_duplicates(records)
+    elapsed = time.perf_counter() - start
+    print(f"{count} records in {elapsed:.2f}s ({count / elapsed:.0f} records/sec)")
+    print(f"{len(exact)} exact duplicates, {len(near)} near duplicate groups")
+
+if __name__ == "__main__":
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
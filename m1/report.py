@@ -0,0 +1,169 @@
+"""
+Streaming printable reports of address book entries.
+
+Records are written one by one through a large write buffer, so a report
+of a million entries never holds more than a chunk of them in memory and
+makes a few big writes instead of one print per entry. Three layouts:
+
+   text -- the same lines as AddressBook.__str__, one block per entry
+   csv -- a header row, then one row per entry
+   fixed -- one line per entry in columns of fixed width
+
+A report can be sorted by any fields. Sorting runs in chunks of
+SORT_CHUNK entries that are spilled to temporary files and merged, so it
+keeps the same memory bound. text and fixed reports can be split into
+pages of page_size entries, separated by a form feed and a page heading.
+
+Records can be AddressBook objects, AddressBookRow views or dicts with the
+same field names.
+
+Functions:
+   write_report -- writes records to a file object in a layout
+   sorted_records -- the field values of records, sorted in bounded memory
+
+Run this file to time a synthetic report.
+"""
+import csv
+import heapq
+import os
+import pickle
+import resource
+import sys
+import tempfile
+import time
+from itertools import islice
+from operator import attrgetter
+
+from addressbook import FIELDS
+
+LABELS = ("First Name", "Last Name", "Birthday", "Email", "Street Address", "City", "State", "Zip", "Phone")
+WIDTHS = (15, 20, 10, 32, 30, 20, 5, 5, 14)
+
+# AddressBook.__str__ plus the newline print() adds after it
+TEXT = "".join(f"{label}: {{}} \n" for label in LABELS) + "\n"
+FIXED = " ".join(f"{{!s:<{width}.{width}}}" for width in WIDTHS) + "\n"
+
+BUFFER_SIZE = 1 << 20
+SORT_CHUNK = 100000
+
+get_fields = attrgetter(*FIELDS)
+
+
+def text_key(value):
+    return str(value).lower()
+
+def zip_key(value):
+    # Zips given as numbers lost their leading zeros, 2134 sorts as 02134
+    text = str(value).strip()
+    head, dash, tail = text.partition("-")
+    return head.zfill(5) + dash + tail if head.isdigit() else text.lower()
+
+# Fields that do not sort as plain lower case text
+SORT_KEYS = {"zip": zip_key}
+
+def field_values(record):
+    # Field values as they are, the layouts turn them into text
+    if isinstance(record, dict):
+        return tuple(record.get(field, "") for field in FIELDS)
+    return get_fields(record)
+
+def sorted_records(records, sort_by, chunk=SORT_CHUNK):
+    """
+    Yields the field values of every record ordered by the sort_by fields.
+    Only one chunk is sorted in memory at a time, the sorted chunks are
+    spilled to temporary files and merged.
+    """
+    keys = [(FIELDS.index(field), SORT_KEYS.get(field, text_key)) for field in sort_by]
+
+    def key(values):
+        return [field_key(values[i]) for i, field_key in keys]
+
+    records = iter(records)
+    runs = []
+    try:
+        while True:
+            run = sorted((field_values(record) for record in islice(records, chunk)), key=key)
+            if not run:
+                break
+            if not runs and len(run) < chunk:
+                # Everything fit in one chunk, no need to touch the disk
+                yield from run
+                return
+            spill = tempfile.TemporaryFile()
+            for values in run:
+                pickle.dump(values, spill, pickle.HIGHEST_PROTOCOL)
+            spill.seek(0)
+            runs.append(spill)
+        yield from heapq.merge(*(read_run(spill) for spill in runs), key=key)
+    finally:
+        for spill in runs:
+            spill.close()
+
+def read_run(spill):
+    while True:
+        try:
+            yield pickle.load(spill)
+        except EOFError:
+            return
+
+def write_report(records, out, layout="text", sort_by=None, page_size=None):
+    """
+    Writes records to the text file object out and returns how many were
+    written. sort_by is a list of field names, page_size the entries per
+    page for text and fixed layouts (None for no page breaks).
+    """
+    rows = sorted_records(records, sort_by) if sort_by else map(field_values, records)
+    if layout == "csv":
+        writer = csv.writer(out)
+        writer.writerow(FIELDS)
+        count = 0
+        for values in rows:
+            writer.writerow(values)
+            count += 1
+        return count
+
+    template = TEXT if layout == "text" else FIXED
+    heading = FIXED.format(*LABELS) if layout == "fixed" else ""
+    batch = []
+    count = 0
+    page = 1
+    if page_size:
+        out.write(f"Page {page}\n\n{heading}")
+    else:
+        out.write(heading)
+    for values in rows:
+        if page_size and count and count % page_size == 0:
+            page += 1
+            batch.append(f"\f\nPage {page}\n\n{heading}")
+        batch.append(template.format(*values))
+        count += 1
+        # Strings are joined in batches so each write call moves a lot of data
+        if len(batch) >= 1000:
+            out.write("".join(batch))
+            batch.clear()
+    out.write("".join(batch))
+    return count
+
+
+def benchmark(count=1000000, layout="text", sort_by=None, page_size=None):
+    from addressbook import AddressBook
+
+    def people():
+        for i in range(count):
+            yield AddressBook(f"First{i}", f"Last{(i * 7919) % count}", "01/01/1990", f"user{i}@example.com",
+                              f"{i} Main St", "Anytown", "NY", 10000 + i % 90000, f"555-{i:07d}")
+
+    with open(os.devnull, "w", buffering=BUFFER_SIZE) as out:
+        start = time.perf_counter()
+        written = write_report(people(), out, layout, sort_by, page_size)
+        elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak = peak / 1024 if sys.platform != "darwin" else peak / 1024 / 1024
+    print(f"{layout}: {written} records in {elapsed:.2f}s ({written / elapsed:.0f} records/sec), "
+          f"peak RSS {peak:.0f} MB")
+
+if __name__ == "__main__":
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    for layout in ("text", "csv", "fixed"):
+        benchmark(size, layout)
+    benchmark(size, "fixed", sort_by=["last_name", "first_name"], page_size=60)
@@ -0,0 +1,136 @@
+# OOP 4.2 Serialization with pickles
+# Runs address book commands from a file or stdin without the menu
+#
+# Usage:
+#   python batch.py [--store shelve|pickle|sqlite] [--quiet] [commands.txt]
+#
+# Reads stdin when no file (or -) is given. One command per line, fields
+# separated by tabs, or by spaces when the line has no tabs:
+#
+#   add FIRST LAST PHONE EMAIL
+#   get BOOK_ID
+#   search FIRST LAST
+#   update BOOK_ID FIELD VALUE
+#   delete BOOK_ID
+#
+# Added and updated contacts are normalized, and rejected with the reasons
+# normalize.py gives when they fail. Blank lines and lines starting with #
+# are skipped. Results go to stdout, errors and the final operations/sec to
+# stderr. Runs of add commands are saved together with put_many, BATCH_SIZE
+# at a time.
+
+import argparse
+import json
+import sys
+import time
+
+from bulk import FIELDS, OPTIONAL_FIELDS
+from normalize import normalize
+from storage import STORES, open_store
+
+BATCH_SIZE = 1000
+
+# Number of fields after the command name
+ARITY = {'add': 4, 'get': 1, 'search': 2, 'update': 3, 'delete': 1}
+
+
+class BatchError(Exception):
+    pass
+
+
+def parse(line):
+    return line.split('\t') if '\t' in line else line.split()
+
+def run(store, lines, out=None):
+    """
+    Runs every command in lines against store and returns (ops, errors).
+    Results are written to out unless it is None.
+    """
+    ops = errors = 0
+    pending = []
+
+    def add_pending():
+        if pending:
+            ids = store.put_many(pending)
+            if out is not None:
+                out.writelines(f"added\t{book_id}\n" for book_id in ids)
+            pending.clear()
+
+    for number, line in enumerate(lines, 1):
+        line = line.rstrip('\r\n')
+        if not line.strip() or line.lstrip().startswith('#'):
+            continue
+        command, *args = parse(line)
+        try:
+            if ARITY.get(command) != len(args):
+                raise BatchError(f"expected {command} with {ARITY.get(command)} fields"
+                                 if command in ARITY else f"unknown command {command}")
+            if command == 'add':
+                pending.append(checked(dict(zip(FIELDS, args))))
+                if len(pending) >= BATCH_SIZE:
+                    add_pending()
+            else:
+                # Later commands have to see the contacts added before them
+                add_pending()
+                result = dispatch(store, command, args)
+                if out is not None:
+                    out.write(result + "\n")
+            ops += 1
+        except (BatchError, KeyError) as e:
+            errors += 1
+            print(f"line {number}: {e}", file=sys.stderr)
+    add_pending()
+    return ops, errors
+
+def checked(info):
+    # Contacts are stored normalized, like from the menu
+    info, errors = normalize(info)
+    if errors:
+        raise BatchError("; ".join(errors))
+    return info
+
+def dispatch(store, command, args):
+    if command == 'search':
+        return "found\t" + "\t".join(store.find(*args))
+
+    book_id = args[0]
+    info = store.get(book_id)
+    if info is None:
+        raise BatchError(f"no contact {book_id}")
+    if command == 'get':
+        return f"{book_id}\t{json.dumps(info)}"
+    if command == 'update':
+        field, value = args[1], args[2]
+        if field not in FIELDS and field not in OPTIONAL_FIELDS:
+            raise BatchError(f"unknown field {field}")
+        info = dict(info)
+        info[field] = value
+        store.put(book_id, checked(info))
+        return f"updated\t{book_id}"
+    store.remove(book_id)
+    return f"deleted\t{book_id}"
+
+def main():
+    parser = argparse.ArgumentParser(description="Run address book commands from a file or stdin")
+    parser.add_argument('commands', nargs='?', default='-')
+    parser.add_argument('--store', choices=list(STORES),
+                        help="defaults to ADDRESS_BOOK_STORE, then shelve")
+    parser.add_argument('--quiet', action='store_true', help="only print errors and the summary")
+    args = parser.parse_args()
+
+    store = open_store(args.store)
+    f = sys.stdin if args.commands == '-' else open(args.commands, encoding='utf-8')
+    start = time.perf_counter()
+    try:
+        ops, errors = run(store, f, None if args.quiet else sys.stdout)
+    finally:
+        store.close()
+        if f is not sys.stdin:
+            f.close()
+    elapsed = time.perf_counter() - start
+    print(f"{ops} commands in {elapsed:.2f}s ({ops / elapsed:.0f} ops/sec), {errors} errors", file=sys.stderr)
+    if errors:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
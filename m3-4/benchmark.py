@@ -0,0 +1,176 @@
+# OOP 4.2 Serialization with pickles
+# Benchmarks the address book backends at several sizes
+#
+# Every backend and size runs in fresh processes inside an empty temp folder:
+# one process inserts the contacts, a second one times cold start, point
+# lookups, updates, deletes and a full iteration. Peak RSS comes from the
+# second process, disk size from the files left in the folder.
+#
+# Usage:
+#   python benchmark.py [--sizes 10000 100000 1000000] [--backends pickle shelve sqlite]
+#                       [--sample 1000] [--output results.json] [--baseline old.json]
+#
+# With --baseline, any time or size more than --tolerance worse than the
+# baseline is reported and the exit status is 1.
+
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from storage import STORES
+
+# New backends only need an entry in storage.STORES
+BACKENDS = STORES
+
+SEED = 42
+BATCH = 1000
+
+FIRST = ["James", "Mary", "John", "Patricia", "Robert", "Jennifer", "Michael", "Linda", "David", "Susan"]
+LAST = ["Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis", "Lopez", "Wilson"]
+
+# Lower is better for every metric
+METRICS = ['insert_s', 'cold_start_s', 'lookup_us', 'update_us', 'delete_us', 'iterate_s', 'peak_rss_mb', 'disk_mb']
+
+
+def contacts(size):
+    rng = random.Random(SEED)
+    for i in range(size):
+        first, last = rng.choice(FIRST), rng.choice(LAST)
+        yield {'first_name': f"{first}{i}", 'last_name': last,
+               'phone_number': f"555-{rng.randrange(10**7):07d}",
+               'email_address': f"{first.lower()}.{last.lower()}{i}@example.com"}
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / 1024 if sys.platform != 'darwin' else peak / 1024 / 1024
+
+def run_insert(backend, size, sample):
+    store = BACKENDS[backend]()
+    start = time.perf_counter()
+    batch = []
+    for info in contacts(size):
+        batch.append(info)
+        if len(batch) == BATCH:
+            store.put_many(batch)
+            batch = []
+    if batch:
+        store.put_many(batch)
+    store.close()
+    return {'insert_s': time.perf_counter() - start}
+
+def run_queries(backend, size, sample):
+    result = {}
+    start = time.perf_counter()
+    store = BACKENDS[backend]()
+    ids = store.ids()
+    result['cold_start_s'] = time.perf_counter() - start
+
+    rng = random.Random(SEED)
+    sample = rng.sample(ids, min(sample, len(ids)))
+
+    start = time.perf_counter()
+    for book_id in sample:
+        store.get(book_id)
+    result['lookup_us'] = (time.perf_counter() - start) / len(sample) * 1e6
+
+    start = time.perf_counter()
+    for book_id in sample:
+        info = dict(store.get(book_id))
+        info['phone_number'] = "555-0000000"
+        store.put(book_id, info)
+    result['update_us'] = (time.perf_counter() - start) / len(sample) * 1e6
+
+    start = time.perf_counter()
+    for book_id in sample:
+        store.remove(book_id)
+    result['delete_us'] = (time.perf_counter() - start) / len(sample) * 1e6
+
+    start = time.perf_counter()
+    for book_id in store.ids():
+        store.get(book_id)
+    result['iterate_s'] = time.perf_counter() - start
+
+    store.close()
+    result['peak_rss_mb'] = peak_rss_mb()
+    return result
+
+def child(phase, backend, size, sample, folder):
+    # Runs one phase in a new interpreter so timings and RSS start cold
+    command = [sys.executable, os.path.abspath(__file__), '--child', phase, backend, str(size), str(sample)]
+    output = subprocess.run(command, cwd=folder, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+def disk_mb(folder):
+    # Every file under the folder, the pickle history lives in a subfolder
+    return sum(os.path.getsize(os.path.join(root, name))
+               for root, _, names in os.walk(folder) for name in names) / 1024 / 1024
+
+def run(backends, sizes, sample):
+    results = []
+    for size in sizes:
+        for backend in backends:
+            with tempfile.TemporaryDirectory() as folder:
+                result = {'backend': backend, 'size': size}
+                result.update(child('insert', backend, size, sample, folder))
+                result.update(child('queries', backend, size, sample, folder))
+                result['disk_mb'] = disk_mb(folder)
+            print(f"{backend:>8} {size:>9}  " + "  ".join(f"{m}={result[m]:.3f}" for m in METRICS))
+            results.append(result)
+    return results
+
+def compare(results, baseline, tolerance):
+    old = {(r['backend'], r['size']): r for r in baseline['results']}
+    regressions = []
+    for result in results:
+        before = old.get((result['backend'], result['size']))
+        if before is None:
+            continue
+        for metric in METRICS:
+            if metric in before and result[metric] > before[metric] * (1 + tolerance):
+                regressions.append(f"{result['backend']} {result['size']} {metric}: "
+                                   f"{before[metric]:.3f} -> {result[metric]:.3f}")
+    return regressions
+
+def main():
+    if len(sys.argv) == 6 and sys.argv[1] == '--child':
+        phase, backend, size, sample = sys.argv[2], sys.argv[3], int(sys.argv[4]), int(sys.argv[5])
+        run_phase = run_insert if phase == 'insert' else run_queries
+        print(json.dumps(run_phase(backend, size, sample)))
+        return
+
+    parser = argparse.ArgumentParser(description="Benchmark the address book backends")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--backends', nargs='+', choices=list(BACKENDS), default=list(BACKENDS))
+    parser.add_argument('--sample', type=int, default=1000,
+                        help="how many contacts to look up, update and delete")
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="how much worse than the baseline counts as a regression (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    results = run(args.backends, args.sizes, args.sample)
+    with open(args.output, 'w') as f:
+        json.dump({'python': platform.python_version(), 'platform': platform.platform(),
+                   'results': results}, f, indent=2)
+    print(f"Wrote {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+        print("No regressions against the baseline")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+# OOP 4.2 Serialization with pickles
+# Bulk import and export for the shelve and pickle address books
+#
+# Usage:
+#   python bulk.py import shelve contacts.csv [--normalize]
+#   python bulk.py export pickle contacts.jsonl
+#
+# With --normalize imported rows go through normalize.py first, and rows
+# it rejects are left out and summarized at the end.
+#
+# A shelve import is written into copies of the book and the name index,
+# which are swapped in together when every row is in. A failed or killed
+# import leaves the book as it was.
+
+import argparse
+import csv
+import json
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+
+from shelflock import ShelfLock, open_shelf
+
+# The shelve field names are used for every row going in or out
+FIELDS = ['first_name', 'last_name', 'phone_number', 'email_address']
+
+# AddressBook fields that are kept when a row has them
+OPTIONAL_FIELDS = ['birthday', 'street_address', 'city', 'state', 'zip']
+
+# picklecrud stores the same fields under different names
+PICKLE_FIELDS = {
+    'First Name': 'first_name',
+    'Last Name': 'last_name',
+    'Number': 'phone_number',
+    'Email': 'email_address',
+}
+
+# and keeps the optional ones, when a record has them, under these
+PICKLE_OPTIONAL_FIELDS = {
+    'Birthday': 'birthday',
+    'Street Address': 'street_address',
+    'City': 'city',
+    'State': 'state',
+    'Zip': 'zip',
+}
+
+# Suffix of the copies an import is staged in
+STAGED = '.import'
+
+
+def read_rows(path):
+    # Rows are read one at a time so the file never has to fit in memory
+    with open(path, newline='', encoding='utf-8') as f:
+        if path.endswith('.jsonl'):
+            lines = (json.loads(line) for line in f if line.strip())
+        else:
+            lines = csv.DictReader(f)
+        for row in lines:
+            row = {PICKLE_FIELDS.get(k, k): v for k, v in row.items()}
+            yield row
+
+def write_rows(path, rows):
+    count = 0
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        if path.endswith('.jsonl'):
+            for row in rows:
+                f.write(json.dumps(row) + '\n')
+                count += 1
+        else:
+            writer = csv.DictWriter(f, fieldnames=['book_id'] + FIELDS + OPTIONAL_FIELDS)
+            writer.writeheader()
+            for row in rows:
+                writer.writerow(row)
+                count += 1
+    return count
+
+def record(row):
+    # The contact in a row, optional fields only when they are filled in
+    info = {field: row.get(field, '') for field in FIELDS}
+    info.update({field: row[field] for field in OPTIONAL_FIELDS if row.get(field)})
+    return info
+
+def import_shelve(rows):
+    import shelvecrud
+    from compact import copy_shelf, finish_swap, shelf_files, stage_swap
+    from shardedshelf import ShardedShelf, shard_of
+    book = shelvecrud.address_book
+    shards = book.shards if isinstance(book, ShardedShelf) else [book]
+    locks = [book.lock] + ([shard.lock for shard in shards] if shards[0] is not book else [])
+    # The import goes into copies of the shelves, which are swapped in whole
+    names = [shard.filename for shard in shards] + [shelvecrud.INDEX_FILE]
+    copies = {name: name + STAGED for name in names}
+    count = 0
+    try:
+        with ExitStack() as held:
+            # Nobody reads or writes the book until the copies are swapped in
+            for lock in locks:
+                held.enter_context(lock.exclusive())
+            finish_swap(book.filename)
+            for name, copy in copies.items():
+                copy_shelf(name, copy)
+            try:
+                with ExitStack() as opened:
+                    staged = [opened.enter_context(open_shelf(copies[shard.filename])) for shard in shards]
+                    index = opened.enter_context(open_shelf(copies[shelvecrud.INDEX_FILE]))
+                    for row in rows:
+                        info = record(row)
+                        book_id = row.get('book_id') or f"{info['first_name']}_{info['last_name']}"
+                        db = staged[shard_of(book_id, len(staged))]
+                        old = db.get(book_id)
+                        if old is not None:
+                            shelvecrud.index_remove(index, book_id, old)
+                        db[book_id] = info
+                        shelvecrud.index_add(index, book_id, info)
+                        count += 1
+            except BaseException:
+                print(f"Import failed after {count} records, the address book is unchanged")
+                for copy in copies.values():
+                    for path in shelf_files(copy):
+                        os.remove(path)
+                raise
+            stage_swap(book.filename, copies)
+            # Every process reopens the book when it sees a new generation
+            for lock in locks:
+                lock.bump()
+            finish_swap(book.filename)
+    finally:
+        book.close()
+    return count
+
+def import_pickle(rows):
+    import picklecrud
+    from storage import to_pickle
+    book = picklecrud.book
+    count = len(book) + 1
+    added = 0
+    for row in rows:
+        book_id = row.get('book_id')
+        if not book_id:
+            while f"book{count}" in book:
+                count += 1
+            book_id = f"book{count}"
+        if book_id in book:
+            picklecrud.forget(book[book_id])
+        book[book_id] = to_pickle(record(row))
+        picklecrud.changed.add(book_id)
+        picklecrud.forget(book[book_id])
+        added += 1
+    # One snapshot for the whole import. It is swapped in atomically, so
+    # a failed import leaves book.pkl as it was
+    picklecrud.checkpoint()
+    return added
+
+def export_shard(filename, path):
+    # Runs in a worker process and writes one shard to its own part file
+    lock = ShelfLock(filename + '.lock')
+    try:
+        with lock.shared(), open_shelf(filename, 'r') as db:
+            return write_rows(path, ({'book_id': book_id, **db[book_id]} for book_id in db.keys()))
+    finally:
+        lock.close()
+
+def join_parts(path, parts):
+    # A csv part starts with its own header, only the first one is kept
+    with open(path, 'wb') as out:
+        for number, part in enumerate(parts):
+            with open(part, 'rb') as f:
+                if number and not path.endswith('.jsonl'):
+                    f.readline()
+                shutil.copyfileobj(f, out)
+            os.remove(part)
+
+def export_shelve(path):
+    import shelvecrud
+    from shardedshelf import ShardedShelf, pool_context
+    book = shelvecrud.address_book
+    try:
+        # Read straight from the shelf so the export does not churn the cache
+        with book.reading() as db:
+            if not isinstance(book, ShardedShelf):
+                rows = ({'book_id': book_id, **db[book_id]} for book_id in db.keys())
+                return write_rows(path, rows)
+            # Each shard is exported by its own worker, then the parts are joined in order
+            root, ext = os.path.splitext(path)
+            parts = [f"{root}.part{shard:02d}{ext}" for shard in range(len(book.shards))]
+            with ProcessPoolExecutor(book.processes, mp_context=pool_context()) as pool:
+                count = sum(pool.map(export_shard, book.filenames, parts))
+            join_parts(path, parts)
+            return count
+    finally:
+        book.close()
+
+def export_pickle(path):
+    import picklecrud
+    from storage import from_pickle
+    rows = ({'book_id': book_id, **from_pickle(info)} for book_id, info in picklecrud.book.items())
+    return write_rows(path, rows)
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import or export the address book")
+    parser.add_argument('action', choices=['import', 'export'])
+    parser.add_argument('store', choices=['shelve', 'pickle'])
+    parser.add_argument('path', help="a .csv or .jsonl file")
+    parser.add_argument('--normalize', action='store_true', help="normalize and validate rows on import")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    rows = read_rows(args.path)
+    report = None
+    if args.action == 'import' and args.normalize:
+        from normalize import Report, clean_rows
+        report = Report()
+        rows = clean_rows(rows, report)
+    if args.action == 'import' and args.store == 'shelve':
+        count = import_shelve(rows)
+    elif args.action == 'import':
+        count = import_pickle(rows)
+    elif args.store == 'shelve':
+        count = export_shelve(args.path)
+    else:
+        count = export_pickle(args.path)
+    elapsed = time.perf_counter() - start
+    rate = count / elapsed if elapsed else 0
+    print(f"{args.action.title()}ed {count} records in {elapsed:.2f}s ({rate:.0f} records/sec)")
+    if report is not None:
+        print(report.summary())
+
+if __name__ == "__main__":
+    main()
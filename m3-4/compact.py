@@ -0,0 +1,169 @@
+# OOP 4.2 Serialization with pickles
+# Compacts the shelve address book
+#
+# Deleted contacts leave dead space behind in the dbm file, which never
+# shrinks by itself. Compacting copies the live records into a fresh file
+# and swaps it in while holding the writer lock, so other processes see
+# either the old file or the new one. A dbm file is several files on disk,
+# so a marker file records the swap until it is done, and a crash part way
+# is finished by the next open_db() or compaction. The name index is
+# compacted too, and swapped in with the book. bulk.py swaps in a staged
+# import the same way.
+#
+# Usage:
+#   python compact.py [--if-above 0.5]
+
+import argparse
+import ast
+import dbm
+import importlib
+import os
+
+from shelflock import ShelfLock, open_db
+
+BOOK_FILE = 'address_book'
+INDEX_FILE = 'address_book_index'
+
+# Every file name a dbm module may add to the name it is given
+SUFFIXES = ['', '.db', '.dat', '.dir', '.bak', '.pag']
+
+DUMB_BLOCK = 512
+
+# The compacted copy is written next to the shelf under this suffix, and
+# the marker file exists while copies are being swapped in
+COPY = '.compact'
+SWAP_MARKER = '.swap'
+
+
+def shelf_files(filename):
+    return [filename + suffix for suffix in SUFFIXES if os.path.isfile(filename + suffix)]
+
+def shelf_size(filename):
+    return sum(os.path.getsize(path) for path in shelf_files(filename))
+
+def dumb_entries(filename):
+    # (key, value size) for every live record, read from the .dir index alone
+    with open(filename + '.dir', encoding='latin-1') as f:
+        for line in f:
+            line = line.rstrip()
+            if line:
+                key, (pos, size) = ast.literal_eval(line)
+                yield key, size
+
+def dead_ratio(filename):
+    # Share of the file not taken up by live keys and values
+    size = shelf_size(filename)
+    if not size:
+        return 0.0
+    if dbm.whichdb(filename) == 'dbm.dumb':
+        # dbm.dumb pads every value out to whole blocks. Only the index is
+        # read, the values in .dat are never touched
+        live = sum(2 * len(key) + -(-length // DUMB_BLOCK) * DUMB_BLOCK
+                   for key, length in dumb_entries(filename))
+    else:
+        with open_db(filename, 'r') as db:
+            live = sum(2 * len(key) + len(db[key]) for key in db.keys())
+    return max(0.0, 1 - live / size)
+
+def sync_file(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def copy_shelf(filename, copy):
+    # Copies the raw pickled records into a fresh file, nothing gets unpickled
+    for path in shelf_files(copy):
+        os.remove(path)
+    module = importlib.import_module(dbm.whichdb(filename))
+    with open_db(filename, 'r') as old, module.open(copy, 'n') as new:
+        for key in old.keys():
+            new[key] = old[key]
+
+def stage_swap(marker, copies):
+    """
+    Writes the marker file that says the complete copies in copies, a
+    dict of shelf name to copy name, are to replace those shelves.
+    Everything is on disk before the marker is, and from then on
+    finish_swap(marker) moves the copies in, however often it is run.
+    """
+    lines = []
+    for name, copy in copies.items():
+        suffixes = [suffix for suffix in SUFFIXES if os.path.isfile(copy + suffix)]
+        for suffix in suffixes:
+            sync_file(copy + suffix)
+        lines.append(f"{name}\t{copy}\t{','.join(suffixes)}\n")
+    with open(marker + SWAP_MARKER, 'w') as f:
+        f.writelines(lines)
+        f.flush()
+        os.fsync(f.fileno())
+
+def finish_swap(marker):
+    """
+    Moves in the copies a marker file lists and removes the marker last,
+    so after a crash part way the next open_db() or compaction finishes
+    the swap. Files another process already moved are skipped.
+    """
+    try:
+        with open(marker + SWAP_MARKER) as f:
+            lines = f.read().splitlines()
+    except FileNotFoundError:
+        return
+    for line in lines:
+        name, copy, suffixes = line.split('\t')
+        suffixes = suffixes.split(',')
+        for suffix in SUFFIXES:
+            try:
+                if suffix in suffixes:
+                    os.replace(copy + suffix, name + suffix)
+                else:
+                    os.remove(name + suffix)
+            except FileNotFoundError:
+                pass
+    try:
+        os.remove(marker + SWAP_MARKER)
+    except FileNotFoundError:
+        pass
+
+def compact(filename=BOOK_FILE, index_file=INDEX_FILE, threshold=None):
+    """
+    Returns (dead_ratio, bytes reclaimed). Bytes reclaimed is None when
+    the dead space is under the threshold and nothing was done.
+    """
+    lock = ShelfLock(filename + '.lock')
+    try:
+        with lock.exclusive():
+            finish_swap(filename)
+            ratio = dead_ratio(filename)
+            if threshold is not None and ratio < threshold:
+                return ratio, None
+            # index_file is None for the shards of a sharded book
+            names = [filename] + ([index_file] if index_file and shelf_files(index_file) else [])
+            before = sum(shelf_size(name) for name in names)
+            copies = {name: name + COPY for name in names}
+            for name, copy in copies.items():
+                copy_shelf(name, copy)
+            stage_swap(filename, copies)
+            # Bumped first, so a process that still has the old files open
+            # reopens them, and finishes the swap if this one dies part way
+            lock.bump()
+            finish_swap(filename)
+            return ratio, before - sum(shelf_size(name) for name in names)
+    finally:
+        lock.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Compact the shelve address book")
+    parser.add_argument('--if-above', type=float, metavar='RATIO',
+                        help="only compact when more than this share of the file is dead space")
+    args = parser.parse_args()
+
+    ratio, reclaimed = compact(threshold=args.if_above)
+    if reclaimed is None:
+        print(f"Dead space is {ratio:.0%}, under {args.if_above:.0%}, nothing to do")
+    else:
+        print(f"Dead space was {ratio:.0%}, reclaimed {reclaimed} bytes")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,9 @@
+# The stores here read and write their files in the working directory,
+# every test runs in its own empty folder so none end up in the checkout
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
@@ -0,0 +1,188 @@
+# OOP 4.2 Serialization with pickles
+# Versioned history for book.pkl
+#
+# Every picklecrud checkpoint becomes a version in HISTORY_DIR. Most
+# versions are deltas holding only the contacts changed since the version
+# before (None for a deleted one). Every BASE_EVERY versions a full base
+# snapshot is written instead, so rebuilding any version reads one base
+# and at most BASE_EVERY - 1 deltas however long the history is.
+#
+# versions.jsonl lists every version with its time and file. Version files
+# use the snapshot encoding, so BOOK_COMPRESSION applies to them too.
+#
+# Usage:
+#   python history.py list
+#   python history.py restore VERSION [--output book.pkl]
+#   python history.py restore --at 2026-10-18T09:30 [--output book.pkl]
+#   python history.py prune [--keep-versions N] [--keep-days D]
+#
+# restore without --output makes the old version the current book, which
+# is recorded as a new version, so a restore can be undone.
+
+import argparse
+import json
+import os
+import time
+from datetime import datetime
+
+from snapshot import read_snapshot, write_snapshot
+
+HISTORY_DIR = 'book_history'
+INDEX = 'versions.jsonl'
+BASE_EVERY = 50
+
+# Retention applied after every new version, None keeps everything
+KEEP_VERSIONS = None
+KEEP_DAYS = None
+
+
+def versions(folder=HISTORY_DIR):
+    path = os.path.join(folder, INDEX)
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def _write(path, data, protocol, compression):
+    with open(path + '.tmp', 'wb') as f:
+        write_snapshot(data, f, protocol, compression)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + '.tmp', path)
+
+def record(book, changed, protocol, compression, folder=HISTORY_DIR):
+    """
+    Adds a version for book. changed holds the ids changed since the last
+    version. Returns the new version number, or None if nothing changed.
+    """
+    history = versions(folder)
+    if history and not changed:
+        return None
+    os.makedirs(folder, exist_ok=True)
+    number = history[-1]['version'] + 1 if history else 1
+    since_base = 0
+    for entry in reversed(history):
+        if entry['kind'] == 'base':
+            break
+        since_base += 1
+    if not history or since_base + 1 >= BASE_EVERY:
+        kind, data = 'base', book
+    else:
+        kind, data = 'delta', {book_id: book.get(book_id) for book_id in changed}
+    name = f"v{number:08d}.{kind}"
+    _write(os.path.join(folder, name), data, protocol, compression)
+    # The version only counts once its file is complete
+    entry = {'version': number, 'time': time.time(), 'kind': kind, 'file': name, 'changes': len(data)}
+    with open(os.path.join(folder, INDEX), 'a') as f:
+        f.write(json.dumps(entry) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    if KEEP_VERSIONS is not None or KEEP_DAYS is not None:
+        prune(KEEP_VERSIONS, KEEP_DAYS, folder)
+    return number
+
+def find_version(history, at):
+    # The last version written at or before the timestamp
+    found = [entry['version'] for entry in history if entry['time'] <= at]
+    if not found:
+        raise KeyError(f"no version at or before {datetime.fromtimestamp(at)}")
+    return found[-1]
+
+def restore(version=None, at=None, folder=HISTORY_DIR):
+    """
+    Returns the book as it was at version, or at the timestamp at, or at
+    the latest version when neither is given.
+    """
+    history = versions(folder)
+    if not history:
+        raise KeyError("no history")
+    if at is not None:
+        version = find_version(history, at)
+    elif version is None:
+        version = history[-1]['version']
+    numbers = [entry['version'] for entry in history]
+    if version not in numbers:
+        raise KeyError(f"no version {version}")
+    chain = history[:numbers.index(version) + 1]
+    start = max(i for i, entry in enumerate(chain) if entry['kind'] == 'base')
+
+    with open(os.path.join(folder, chain[start]['file']), 'rb') as f:
+        book = read_snapshot(f)
+    for entry in chain[start + 1:]:
+        with open(os.path.join(folder, entry['file']), 'rb') as f:
+            delta = read_snapshot(f)
+        for book_id, info in delta.items():
+            if info is None:
+                book.pop(book_id, None)
+            else:
+                book[book_id] = info
+    return book
+
+def prune(keep_versions=None, keep_days=None, folder=HISTORY_DIR):
+    """
+    Drops versions older than the newest keep_versions and older than
+    keep_days, but keeps the base the oldest remaining version needs.
+    Returns how many versions were removed.
+    """
+    history = versions(folder)
+    keep = len(history)
+    if keep_versions is not None:
+        keep = min(keep, keep_versions)
+    if keep_days is not None:
+        cutoff = time.time() - keep_days * 86400
+        keep = min(keep, sum(1 for entry in history if entry['time'] >= cutoff))
+    # Always keep the latest version so the current book can be rebuilt
+    oldest = len(history) - max(keep, 1)
+    while oldest > 0 and history[oldest]['kind'] != 'base':
+        oldest -= 1
+    if oldest <= 0:
+        return 0
+
+    # Rewrite the index first, a crash then leaves unused files, not missing ones
+    path = os.path.join(folder, INDEX)
+    with open(path + '.tmp', 'w') as f:
+        f.writelines(json.dumps(entry) + "\n" for entry in history[oldest:])
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + '.tmp', path)
+    for entry in history[:oldest]:
+        os.remove(os.path.join(folder, entry['file']))
+    return oldest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Versioned history of the pickle address book")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('list')
+    restore_parser = commands.add_parser('restore')
+    restore_parser.add_argument('version', type=int, nargs='?')
+    restore_parser.add_argument('--at', type=datetime.fromisoformat, help="an ISO date and time")
+    restore_parser.add_argument('--output', help="write the version here instead of making it current")
+    prune_parser = commands.add_parser('prune')
+    prune_parser.add_argument('--keep-versions', type=int)
+    prune_parser.add_argument('--keep-days', type=float)
+    args = parser.parse_args()
+
+    if args.command == 'list':
+        for entry in versions():
+            stamp = datetime.fromtimestamp(entry['time']).isoformat(timespec='seconds')
+            print(f"{entry['version']:>8} {stamp} {entry['kind']:>5} {entry['changes']:>8} contacts")
+    elif args.command == 'prune':
+        print(f"Removed {prune(args.keep_versions, args.keep_days)} versions")
+    else:
+        at = args.at.timestamp() if args.at else None
+        start = time.perf_counter()
+        try:
+            book = restore(args.version, at)
+        except KeyError as e:
+            parser.error(e.args[0])
+        elapsed = time.perf_counter() - start
+        import picklecrud
+        if args.output:
+            _write(args.output, book, picklecrud.PROTOCOL, picklecrud.COMPRESSION)
+        else:
+            picklecrud.replace_book(book)
+        print(f"Restored {len(book)} contacts in {elapsed:.3f}s")
+
+if __name__ == "__main__":
+    main()
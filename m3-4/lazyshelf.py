@@ -0,0 +1,227 @@
+# OOP 4.2 Serialization with pickles
+
+import dbm
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+
+from shelflock import ShelfLock, open_shelf, sync_shelf
+
+
+class TrackedRecord(dict):
+    """
+    A record read from a LazyShelf. Changing it in place marks it dirty
+    with its shelf, so only edited records are written back on flush.
+
+    Attributes:
+    shelf: LazyShelf -- the shelf the record was read from
+    book_id: str -- the key the record is stored under
+    before: dict -- the record as last written, None while unchanged
+    """
+    def __init__(self, shelf, book_id, data):
+        super().__init__(data)
+        self.shelf = shelf
+        self.book_id = book_id
+        self.before = None
+
+    def _touch(self):
+        if self.before is None:
+            self.before = dict(self)
+            self.shelf.dirty[self.book_id] = self
+
+    def __setitem__(self, key, value):
+        self._touch()
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key):
+        self._touch()
+        super().__delitem__(key)
+
+    def update(self, *args, **kwargs):
+        self._touch()
+        super().update(*args, **kwargs)
+
+    def pop(self, *args):
+        self._touch()
+        return super().pop(*args)
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self._touch()
+        return super().setdefault(key, default)
+
+    def popitem(self):
+        self._touch()
+        return super().popitem()
+
+    def clear(self):
+        self._touch()
+        super().clear()
+
+    def __ior__(self, other):
+        self._touch()
+        return super().__ior__(other)
+
+    def __reduce__(self):
+        # Pickled as a plain dict, the shelf it came from is not saved
+        return (dict, (dict(self),))
+
+
+class LazyShelf(MutableMapping):
+    """
+    A dict-like view over a shelf that keeps the shelf open and only
+    unpickles a record the first time it is read.
+
+    Several processes can use the same shelf. Reads take a shared lock and
+    writes take an exclusive one. The shelf stays open between them, opening
+    a dbm.dumb file reads its whole index. It is reopened, and the cache
+    dropped, only when another process has written. A writer syncs the
+    shelf and bumps the generation when it lets go, and only if it wrote.
+
+    Attributes:
+    filename: str -- the shelf file
+    db: Shelf -- the open shelf, None until first used
+    writable: bool -- the shelf is open for writing
+    changed: bool -- written to since the exclusive lock was taken
+    lock: ShelfLock -- the lock shared with other processes
+    cache: OrderedDict -- the most recently used records, oldest first
+    cache_size: int -- how many records the cache can hold
+    dirty: dict -- records edited in place and not written back yet
+
+    Methods:
+    reading: Context manager holding the shared lock, yields the shelf
+    writing: Context manager holding the exclusive lock, yields the shelf
+    sync: Writes pending changes to disk while writing
+    close: Closes the shelf
+    """
+    def __init__(self, filename, cache_size=1024, timeout=10.0):
+        self.filename = filename
+        self.db = None
+        self.writable = False
+        self.changed = False
+        self.writer = False
+        self.reader = False
+        self.generation = None
+        self.lock = ShelfLock(filename + '.lock', timeout)
+        self.cache = OrderedDict()
+        self.cache_size = cache_size
+        self.dirty = {}
+        # Creates the shelf if it is not there yet. It had nothing in it,
+        # so the generation stays and other processes keep their caches
+        if dbm.whichdb(filename) is None:
+            with self.lock.exclusive():
+                if dbm.whichdb(filename) is None:
+                    open_shelf(filename, 'c').close()
+
+    @contextmanager
+    def reading(self):
+        if self.writer or self.reader:
+            yield self.db
+            return
+        with self.lock.shared():
+            self._open(self.writable)
+            self.reader = True
+            try:
+                yield self.db
+            finally:
+                self.reader = False
+
+    @contextmanager
+    def writing(self):
+        if self.writer:
+            yield self.db
+            return
+        with self.lock.exclusive():
+            self._open(True)
+            self.writer = True
+            try:
+                yield self.db
+            finally:
+                self.writer = False
+                if self.changed:
+                    # Other processes read the index from disk, so it has
+                    # to be written out before the lock is let go
+                    sync_shelf(self.db)
+                    self.generation = self.lock.bump()
+                    self.changed = False
+
+    def _open(self, write):
+        # Opens the shelf, again only if another process wrote since or it
+        # has to be writable and is not
+        generation = self.lock.generation()
+        if self.db is not None and generation == self.generation and (self.writable or not write):
+            return
+        if self.db is not None:
+            self.db.close()
+        if generation != self.generation:
+            self.cache.clear()
+        self.db = open_shelf(self.filename, 'c' if write else 'r')
+        self.writable = write
+        self.generation = generation
+
+    def __getitem__(self, key):
+        if key in self.dirty:
+            return self.dirty[key]
+        with self.reading() as db:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                return self.cache[key]
+            value = db[key]
+        return self._remember(key, value)
+
+    def __setitem__(self, key, value):
+        with self.writing() as db:
+            db[key] = value
+            self.changed = True
+            self.dirty.pop(key, None)
+            self._remember(key, value)
+
+    def __delitem__(self, key):
+        with self.writing() as db:
+            del db[key]
+            self.changed = True
+            self.cache.pop(key, None)
+            self.dirty.pop(key, None)
+
+    def __contains__(self, key):
+        with self.reading() as db:
+            return key in self.cache or key in db
+
+    def __iter__(self):
+        # Only the keys are read, no records get unpickled
+        with self.reading() as db:
+            keys = list(db.keys())
+        return iter(keys)
+
+    def __len__(self):
+        with self.reading() as db:
+            return len(db)
+
+    def _remember(self, key, value):
+        # Records come back tracked, a record just written is clean again
+        if isinstance(value, TrackedRecord) and value.shelf is self and value.book_id == key:
+            value.before = None
+        elif isinstance(value, dict):
+            value = TrackedRecord(self, key, value)
+        self.cache[key] = value
+        self.cache.move_to_end(key)
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return value
+
+    def sync(self):
+        if self.writer:
+            self.db.sync()
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+            self.writable = False
+        self.lock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,88 @@
+# OOP 4.2 Serialization with pickles
+# Load generator for server.py
+#
+# Opens a number of keep-alive connections and sends a mix of list, search,
+# get and add requests until the time is up, then prints p50/p99 latency
+# and requests per second.
+#
+# Usage:
+#   python loadgen.py [--port 8080] [--connections 16] [--seconds 10]
+
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+
+
+async def request(reader, writer, method, path, body=None):
+    data = json.dumps(body).encode() if body is not None else b''
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: localhost\r\n"
+                 f"Content-Length: {len(data)}\r\n\r\n".encode() + data)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.lower() == 'content-length':
+            length = int(value)
+    return status, json.loads(await reader.readexactly(length))
+
+def contact(n):
+    return {'first_name': f"Load{n}", 'last_name': "Test",
+            'phone_number': f"555-{n:07d}", 'email_address': f"load{n}@example.com"}
+
+async def client(host, port, deadline, latencies, errors, write_ratio):
+    reader, writer = await asyncio.open_connection(host, port)
+    cursor = None
+    try:
+        while time.perf_counter() < deadline:
+            n = random.randrange(100000)
+            roll = random.random()
+            if roll < write_ratio:
+                method, path, body = 'POST', '/contacts', contact(n)
+            elif roll < 0.4:
+                method, path, body = 'GET', f"/contacts?limit=50{'&cursor=' + cursor if cursor else ''}", None
+            elif roll < 0.7:
+                method, path, body = 'GET', f"/contacts/search?first=Load{n}&last=Test", None
+            else:
+                method, path, body = 'GET', f"/contacts/Load{n}_Test", None
+            start = time.perf_counter()
+            status, result = await request(reader, writer, method, path, body)
+            latencies.append(time.perf_counter() - start)
+            if status >= 500 or (status >= 400 and status != 404):
+                errors.append(status)
+            if path.startswith('/contacts?'):
+                cursor = result.get('next_cursor')
+    finally:
+        writer.close()
+
+async def main():
+    parser = argparse.ArgumentParser(description="Load test the address book server")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--connections', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--write-ratio', type=float, default=0.1)
+    args = parser.parse_args()
+
+    latencies = []
+    errors = []
+    start = time.perf_counter()
+    deadline = start + args.seconds
+    await asyncio.gather(*(client(args.host, args.port, deadline, latencies, errors, args.write_ratio)
+                           for _ in range(args.connections)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    cuts = statistics.quantiles(latencies, n=100)
+    print(f"{len(latencies)} requests over {args.connections} connections in {elapsed:.1f}s")
+    print(f"{len(latencies) / elapsed:.0f} requests/sec, {len(errors)} errors")
+    print(f"p50 {cuts[49] * 1000:.2f} ms, p99 {cuts[98] * 1000:.2f} ms")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,129 @@
+# OOP 4.2 Serialization with pickles
+# The address book menu on top of any store from storage.py
+#
+# Usage:
+#   python menu.py [shelve|pickle|sqlite]
+#
+# Without an argument the store comes from ADDRESS_BOOK_STORE, then shelve.
+# Running picklecrud.py or shelvecrud.py opens this menu over that store.
+# Options the store has no method for are left out.
+
+import sys
+
+from normalize import normalize
+from storage import open_store
+
+# Menu choice 3 edits one of these
+EDITABLE = {
+    "1": ("first_name", "New Name: "),
+    "2": ("last_name", "New Last Name: "),
+    "3": ("phone_number", "New Phone Number: "),
+    "4": ("email_address", "New Email: "),
+}
+
+
+def options(store):
+    # (label, function) for every option the store supports, in menu order
+    found = [("Add New User", add), ("Search for Existing User", search),
+             ("Change Existing User", update), ("Delete Existing User", delete)]
+    if hasattr(store, 'prefix'):
+        found.append(("Search by Name or Email Prefix", prefix_search))
+    if hasattr(store, 'range'):
+        found.append(("Find by Zip, State or Birthday", range_search))
+    return found
+
+def choice(store):
+    # One loop runs the menu, every operation returns here when it is done
+    menu = options(store)
+    while True:
+        print("Address Book Menu:\n " + "".join(f"{number}. {label}\n "
+                                                for number, (label, _) in enumerate(menu, 1))
+              + f"{len(menu) + 1}. Exit")
+        x = input("input: ")
+        if x.isdigit() and 1 <= int(x) <= len(menu):
+            print(f"goto {x}")
+            menu[int(x) - 1][1](store)
+        else:
+            print("exit")
+            store.close()
+            return
+
+def add(store):
+    print("Please input First Name:")
+    fname = input("Input: ")
+    print("Please input Last Name:")
+    lname = input("Input: ")
+    print("Please input Phone Number:")
+    num = input("Input: ")
+    print("Please input Email:")
+    ema = input("Input: ")
+    info, errors = normalize({'first_name': fname, 'last_name': lname, 'phone_number': num, 'email_address': ema})
+    if errors:
+        print("Not saved: " + "; ".join(errors))
+        return
+    store.put(None, info)
+
+def show(store, found):
+    for book_id in found:
+        print(f"Found Address: {book_id}")
+        print(f"Address {store.get(book_id)}")
+    if not found:
+        print("No Address found.")
+
+def search(store):
+    inp1 = input("Please Input the first name: ")
+    inp2 = input("Please Input the last name: ")
+    for book_id in store.find(inp1, inp2):
+        print(f"Found Address: {book_id}")
+        print(f"Address {store.get(book_id)}")
+        return book_id
+    print("No Address found.")
+
+def prefix_search(store):
+    show(store, store.prefix(input("Please Input the start of a name or email: ")))
+
+def range_search(store):
+    print("1. Zip range\n2. State\n3. Birthdays this week")
+    x = input("input: ")
+    if x == "1":
+        found = store.range('zip', input("From zip: "), input("To zip: "))
+    elif x == "2":
+        state = input("State: ")
+        found = store.range('state', state, state)
+    else:
+        found = store.birthdays_this_week()
+    show(store, found)
+
+def update(store):
+    book_id = search(store)
+    if book_id is None:
+        return
+    print("What would you like to change")
+    x = input("input: ")
+    if x not in EDITABLE:
+        print("exit")
+        return
+    field, prompt = EDITABLE[x]
+    info = dict(store.get(book_id))
+    info[field] = input(prompt)
+    info, errors = normalize(info)
+    if errors:
+        print("Not saved: " + "; ".join(errors))
+        return
+    store.put(book_id, info)
+
+def delete(store):
+    book_id = search(store)
+    if book_id is None:
+        return
+    while True:
+        inp1 = input(f"Are you sure you would like to delete {book_id}? (yes/no)")
+        if inp1 == "yes":
+            store.remove(book_id)
+            return
+        if inp1 == "no":
+            return
+        print("Please type yes or no!")
+
+if __name__ == "__main__":
+    choice(open_store(sys.argv[1] if len(sys.argv) > 1 else None))
@@ -0,0 +1,154 @@
+# OOP 4.2 Serialization with pickles
+# Per-operation latency histograms, counts and bytes written
+#
+# Off unless ADDRESS_BOOK_METRICS names a file when the CRUD modules are
+# imported. Then every timed operation is counted in a latency histogram
+# and the totals are written to that file when the process exits: as
+# Prometheus text if the name ends in .prom, as JSON otherwise. With
+# ADDRESS_BOOK_METRICS_EVERY set to a number of seconds the file is also
+# written that often while the process runs, and server.py serves the
+# same text at GET /metrics.
+#
+#   ADDRESS_BOOK_METRICS=metrics.prom python batch.py --store pickle commands.txt
+#
+# Every store times its calls under the same names: add and update for
+# put() of a new and an existing contact, search, delete and save_many.
+# The rest (flush, write_record, journal, checkpoint) are particular to
+# one store.
+#
+# When it is off, timed() hands back the function it was given, so there
+# is nothing between the caller and the operation.
+
+import atexit
+import functools
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+
+OUTPUT = os.environ.get('ADDRESS_BOOK_METRICS') or None
+ENABLED = OUTPUT is not None
+EVERY = float(os.environ.get('ADDRESS_BOOK_METRICS_EVERY') or 0)
+
+# Upper bounds of the histogram buckets in seconds, the last bucket is +Inf
+BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+           0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Operation():
+    """
+    Latency histogram and byte count for one operation of one store.
+
+    Attributes:
+    buckets: list -- calls per latency bucket, the last one past every bound
+    count: int -- calls
+    seconds: float -- total time spent
+    bytes: int -- bytes written to disk
+    """
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.seconds = 0.0
+        self.bytes = 0
+
+    def observe(self, seconds):
+        self.buckets[bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.seconds += seconds
+
+    def quantile(self, q):
+        # The bucket bound the q-th call falls under
+        rank = q * self.count
+        seen = 0
+        for bound, calls in zip(BUCKETS + (float('inf'),), self.buckets):
+            seen += calls
+            if seen >= rank and calls:
+                return bound
+        return 0.0
+
+
+# (store, operation) -> Operation
+operations = {}
+
+def operation(store, name):
+    key = (store, name)
+    if key not in operations:
+        operations[key] = Operation()
+    return operations[key]
+
+def timed(store, name):
+    """
+    Decorator that times every call as operation name of store. name can
+    also be a function, called with the same arguments before each call,
+    that returns the operation name. Returns the function untouched when
+    metrics are off.
+    """
+    def decorate(function):
+        if not ENABLED:
+            return function
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            stats = operation(store, name(*args, **kwargs) if callable(name) else name)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                stats.observe(time.perf_counter() - start)
+        return wrapper
+    return decorate
+
+def written(store, name, nbytes):
+    if ENABLED:
+        operation(store, name).bytes += nbytes
+
+def used():
+    # Operations that were timed but never called are left out. Copied
+    # first, another thread may be adding one
+    return [(key, op) for key, op in sorted(list(operations.items())) if op.count or op.bytes]
+
+def to_json():
+    return json.dumps({'operations': [
+        {'store': store, 'operation': name, 'count': op.count, 'seconds': op.seconds,
+         'mean_us': op.seconds / op.count * 1e6 if op.count else 0.0,
+         'p50_us': op.quantile(0.5) * 1e6, 'p99_us': op.quantile(0.99) * 1e6,
+         'bytes_written': op.bytes,
+         'buckets': {str(bound): calls for bound, calls in zip(BUCKETS + ('+Inf',), op.buckets)}}
+        for (store, name), op in used()]}, indent=2)
+
+def to_prometheus():
+    lines = ["# HELP addressbook_operation_seconds Latency of address book operations",
+             "# TYPE addressbook_operation_seconds histogram"]
+    for (store, name), op in used():
+        labels = f'store="{store}",operation="{name}"'
+        total = 0
+        for bound, calls in zip(BUCKETS + ('+Inf',), op.buckets):
+            total += calls
+            lines.append(f'addressbook_operation_seconds_bucket{{{labels},le="{bound}"}} {total}')
+        lines.append(f"addressbook_operation_seconds_sum{{{labels}}} {op.seconds}")
+        lines.append(f"addressbook_operation_seconds_count{{{labels}}} {op.count}")
+    lines += ["# HELP addressbook_bytes_written_total Bytes written to disk by address book operations",
+              "# TYPE addressbook_bytes_written_total counter"]
+    for (store, name), op in used():
+        if op.bytes:
+            lines.append(f'addressbook_bytes_written_total{{store="{store}",operation="{name}"}} {op.bytes}')
+    return "\n".join(lines) + "\n"
+
+def dump(path=None):
+    path = path or OUTPUT
+    text = to_prometheus() if path.endswith('.prom') else to_json()
+    # Written whole and swapped in, so a scraper never reads half a file
+    with open(path + '.tmp', 'w') as f:
+        f.write(text)
+    os.replace(path + '.tmp', path)
+
+def dump_every(seconds):
+    while True:
+        time.sleep(seconds)
+        dump()
+
+if ENABLED:
+    atexit.register(dump)
+    if EVERY:
+        threading.Thread(target=dump_every, args=(EVERY,), daemon=True).start()
@@ -0,0 +1,125 @@
+# OOP 4.2 Serialization with pickles
+# Copies the address book from one store to another
+#
+# Usage:
+#   python migrate.py pickle shelve [--batch N] [--restart]
+#
+# Records are read from the source and written to the target BATCH_SIZE at
+# a time through the storage.py interface, so the field names are mapped
+# the same way everywhere ("First Name"/"Number" in picklecrud,
+# first_name/phone_number in the shelf and in sqlite) and book ids are kept.
+# Only the ids are held whole, one batch of records at a time, but the
+# pickle store keeps its whole book in memory whichever side it is on.
+#
+# Ids are copied in sorted order. After every batch reaches the target the
+# last id copied is saved to STATE_FILE, and running the same migration
+# again carries on after it. Writes to the target replace what is there,
+# so a batch that was cut short is simply copied again. The source should
+# not be changed until the migration is done. Progress and records/sec are
+# printed every PROGRESS_EVERY seconds.
+
+import argparse
+import json
+import os
+import sys
+import time
+from itertools import islice
+
+from storage import STORES, open_store
+
+BATCH_SIZE = 1000
+STATE_FILE = 'migrate.state'
+PROGRESS_EVERY = 1.0
+
+
+class MigrateError(Exception):
+    pass
+
+
+def read_state(source, target):
+    if not os.path.exists(STATE_FILE):
+        return None
+    with open(STATE_FILE) as f:
+        state = json.load(f)
+    if (state['source'], state['target']) != (source, target):
+        raise MigrateError(f"{STATE_FILE} is for a migration from {state['source']} to {state['target']}, "
+                           "finish that one or start over with --restart")
+    return state
+
+def write_state(state):
+    # Written whole and swapped in, a crash leaves the old state or the new one
+    with open(STATE_FILE + '.tmp', 'w') as f:
+        json.dump(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(STATE_FILE + '.tmp', STATE_FILE)
+
+def migrate(source, target, batch_size=BATCH_SIZE, restart=False, out=sys.stderr):
+    """
+    Copies every record of the store named source into the store named
+    target and returns how many were copied by this run. Resumes a
+    migration that was interrupted unless restart is set.
+    """
+    if source == target:
+        raise MigrateError("source and target are the same store")
+    state = None if restart else read_state(source, target)
+    if state is None:
+        state = {'source': source, 'target': target, 'last_id': None, 'copied': 0}
+
+    reader = open_store(source)
+    writer = open_store(target)
+    try:
+        ids = sorted(reader.ids())
+        total = len(ids)
+        if state['last_id'] is not None:
+            ids = [book_id for book_id in ids if book_id > state['last_id']]
+            print(f"Resuming after {state['last_id']}, {state['copied']} of {total} records already copied",
+                  file=out)
+        start = last_report = time.perf_counter()
+        copied = 0
+        remaining = iter(ids)
+        while True:
+            batch = list(islice(remaining, batch_size))
+            if not batch:
+                break
+            records = [reader.get(book_id) for book_id in batch]
+            writer.put_many(records, batch)
+            copied += len(batch)
+            state['last_id'] = batch[-1]
+            state['copied'] += len(batch)
+            write_state(state)
+
+            now = time.perf_counter()
+            if now - last_report >= PROGRESS_EVERY:
+                last_report = now
+                print(f"{state['copied']}/{total} records ({state['copied'] / total:.0%}), "
+                      f"{copied / (now - start):.0f} records/sec", file=out)
+    finally:
+        writer.close()
+        reader.close()
+    # Only a finished migration forgets where it was
+    if os.path.exists(STATE_FILE):
+        os.remove(STATE_FILE)
+    elapsed = time.perf_counter() - start
+    print(f"Copied {copied} records from {source} to {target} in {elapsed:.2f}s "
+          f"({copied / elapsed if elapsed else 0:.0f} records/sec)", file=out)
+    return copied
+
+def main():
+    parser = argparse.ArgumentParser(description="Copy the address book from one store to another")
+    parser.add_argument('source', choices=list(STORES))
+    parser.add_argument('target', choices=list(STORES))
+    parser.add_argument('--batch', type=int, default=BATCH_SIZE, help="records written together")
+    parser.add_argument('--restart', action='store_true', help=f"ignore {STATE_FILE} and copy everything")
+    args = parser.parse_args()
+    try:
+        migrate(args.source, args.target, args.batch, args.restart)
+    except MigrateError as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
+    except KeyboardInterrupt:
+        print(f"Interrupted, run it again to carry on from {STATE_FILE}", file=sys.stderr)
+        sys.exit(130)
+
+if __name__ == "__main__":
+    main()
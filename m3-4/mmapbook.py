@@ -0,0 +1,206 @@
+# OOP 4.2 Serialization with pickles
+# A fixed layout binary address book that can be read with mmap
+#
+# Layout (all numbers little endian):
+#   header   "ABK2", field count (uint32), record count (uint64)
+#   fields   the field names, each as a uint32 length and utf-8 bytes
+#   offsets  one uint64 per record giving where the record starts
+#   records  book id then every field, each as a uint32 length and utf-8 bytes.
+#            A field the record does not have, or that is None, is stored
+#            as the length ABSENT with no bytes and left out when read
+#
+# Records are written sorted by book id, so a single record can be found by
+# binary search over the offset table without reading the rest of the file.
+# Files from before ABSENT existed start with "ABK1" and are still read.
+#
+# Usage:
+#   python mmapbook.py frompickle book.pkl book.bin
+#   python mmapbook.py topickle book.bin book.pkl
+#
+# frompickle reads the journal next to the pickle (book.log for book.pkl)
+# too, so changes picklecrud has not checkpointed yet are included.
+# topickle removes that journal, it was written against the old book.
+
+import mmap
+import os
+import pickle
+import struct
+import sys
+from array import array
+from collections.abc import Mapping
+
+from bulk import PICKLE_FIELDS, PICKLE_OPTIONAL_FIELDS
+from snapshot import read_book
+
+MAGIC = b"ABK2"
+# Magic numbers of layouts that can be read
+READABLE = (b"ABK1", MAGIC)
+HEADER = struct.Struct("<4sIQ")
+LENGTH = struct.Struct("<I")
+OFFSET = struct.Struct("<Q")
+ABSENT = 0xFFFFFFFF
+
+# picklecrud field names, the optional ones are absent from most records
+FIELDS = list(PICKLE_FIELDS) + list(PICKLE_OPTIONAL_FIELDS)
+
+
+def write_string(f, text):
+    if text is None:
+        f.write(LENGTH.pack(ABSENT))
+        return
+    data = str(text).encode("utf-8")
+    f.write(LENGTH.pack(len(data)))
+    f.write(data)
+
+def dump_book(f, ids, records, fields=FIELDS):
+    # ids sorted, records the info dicts in the same order. f has to be seekable
+    f.write(HEADER.pack(MAGIC, len(fields), len(ids)))
+    for field in fields:
+        write_string(f, field)
+    table = f.tell()
+    f.write(bytes(OFFSET.size * len(ids)))
+    offsets = array("Q")
+    for book_id, info in zip(ids, records):
+        offsets.append(f.tell())
+        write_string(f, book_id)
+        for field in fields:
+            write_string(f, info.get(field))
+    end = f.tell()
+    f.seek(table)
+    if sys.byteorder != "little":
+        offsets.byteswap()
+    f.write(offsets.tobytes())
+    f.seek(end)
+
+def write_book(book, path, fields=FIELDS):
+    # Write to a temp file and swap it in so readers never see half a file
+    ids = sorted(book)
+    with open(path + ".tmp", "wb") as f:
+        dump_book(f, ids, (book[book_id] for book_id in ids), fields)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + ".tmp", path)
+
+
+class BookView(Mapping):
+    """
+    A read only dict-like view of an address book in the binary layout,
+    over any buffer. Only the records that are looked up get decoded.
+
+    Attributes:
+    map: the buffer holding the book
+    fields: list -- the field names stored for every record
+    count: int -- number of records
+
+    Methods:
+    record: Returns (book_id, info) for the record at a position
+    """
+    def __init__(self, buffer, name="buffer"):
+        self.map = buffer
+        magic, field_count, self.count = HEADER.unpack_from(self.map, 0)
+        if magic not in READABLE:
+            raise ValueError(f"{name} is not an address book file")
+        pos = HEADER.size
+        self.fields = []
+        for _ in range(field_count):
+            field, pos = self._string(pos)
+            self.fields.append(field)
+        self.table = pos
+
+    def _string(self, pos):
+        (length,) = LENGTH.unpack_from(self.map, pos)
+        pos += LENGTH.size
+        if length == ABSENT:
+            return None, pos
+        return str(self.map[pos:pos + length], "utf-8"), pos + length
+
+    def _offset(self, i):
+        return OFFSET.unpack_from(self.map, self.table + i * OFFSET.size)[0]
+
+    def _key(self, i):
+        return self._string(self._offset(i))[0]
+
+    def record(self, i):
+        book_id, pos = self._string(self._offset(i))
+        info = {}
+        for field in self.fields:
+            value, pos = self._string(pos)
+            if value is not None:
+                info[field] = value
+        return book_id, info
+
+    def __getitem__(self, book_id):
+        low, high = 0, self.count
+        while low < high:
+            mid = (low + high) // 2
+            if self._key(mid) < book_id:
+                low = mid + 1
+            else:
+                high = mid
+        if low < self.count and self._key(low) == book_id:
+            return self.record(low)[1]
+        raise KeyError(book_id)
+
+    def __iter__(self):
+        for i in range(self.count):
+            yield self._key(i)
+
+    def __len__(self):
+        return self.count
+
+    def items(self):
+        for i in range(self.count):
+            yield self.record(i)
+
+
+class MmapBook(BookView):
+    """
+    A BookView of a binary address book file mapped with mmap.
+
+    Methods:
+    close: Unmaps and closes the file
+    """
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        super().__init__(mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ), path)
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def log_path(pickle_path):
+    # picklecrud journals book.pkl to book.log
+    return os.path.splitext(pickle_path)[0] + ".log"
+
+def pickle_to_mmap(pickle_path, path):
+    book = read_book(pickle_path, log_path(pickle_path))
+    write_book(book, path)
+    return len(book)
+
+def mmap_to_pickle(path, pickle_path):
+    with MmapBook(path) as book:
+        data = dict(book.items())
+    with open(pickle_path + ".tmp", "wb") as f:
+        pickle.dump(data, f)
+    os.replace(pickle_path + ".tmp", pickle_path)
+    # Replayed over the new book it would bring back the old contacts
+    if os.path.exists(log_path(pickle_path)):
+        os.remove(log_path(pickle_path))
+    return len(data)
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4 or sys.argv[1] not in ("frompickle", "topickle"):
+        print("Usage: python mmapbook.py frompickle|topickle SOURCE DEST")
+        sys.exit(1)
+    if sys.argv[1] == "frompickle":
+        count = pickle_to_mmap(sys.argv[2], sys.argv[3])
+    else:
+        count = mmap_to_pickle(sys.argv[2], sys.argv[3])
+    print(f"Converted {count} records")
@@ -0,0 +1,212 @@
+# OOP 4.2 Serialization with pickles
+# Normalizes and validates contact fields
+#
+# Names are trimmed with runs of spaces collapsed, emails are trimmed,
+# lower cased and checked for a user@domain.tld shape, and phone numbers
+# are reduced to their digits and written one way: 555-123-4567 for US
+# numbers, 123-4567 for local ones and +<digits> for international ones.
+# Contacts with an empty name or a bad email or phone are rejected.
+#
+# Records use the shelve field names. Runs of PARALLEL_AT records or more
+# are split into chunks and normalized in a process pool.
+#
+# Usage:
+#   python normalize.py [--store shelve|pickle|sqlite] [--apply] [--processes N]
+#
+# Without --apply the store is only checked and nothing is written. With
+# it the changed records are written back BATCH_SIZE at a time.
+
+import argparse
+import os
+import re
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, islice
+
+from storage import STORES, open_store
+
+PARALLEL_AT = 20000
+CHUNK_SIZE = 5000
+BATCH_SIZE = 1000
+
+EMAIL = re.compile(r"[^@\s]+@[^@\s]+\.[^@\s.]+")
+NOT_DIGIT = re.compile(r"\D")
+
+
+def normalize_name(value):
+    return " ".join(str(value).split())
+
+def normalize_email(value):
+    email = str(value).strip().lower()
+    if email and not EMAIL.fullmatch(email):
+        raise ValueError("email is not user@domain.tld")
+    return email
+
+def normalize_phone(value):
+    value = str(value).strip()
+    digits = NOT_DIGIT.sub("", value)
+    if not digits:
+        if value:
+            raise ValueError("phone has no digits")
+        return ""
+    if value.startswith("+") and not (digits.startswith("1") and len(digits) == 11):
+        if not 8 <= len(digits) <= 15:
+            raise ValueError("international phone needs 8 to 15 digits")
+        return "+" + digits
+    # Drop the US country code so 1-555-... and 555-... are stored the same
+    if len(digits) == 11 and digits.startswith("1"):
+        digits = digits[1:]
+    if len(digits) == 10:
+        return f"{digits[:3]}-{digits[3:6]}-{digits[6:]}"
+    if len(digits) == 7:
+        return f"{digits[:3]}-{digits[3:]}"
+    raise ValueError("phone needs 7 or 10 digits")
+
+CLEANERS = {
+    'first_name': normalize_name,
+    'last_name': normalize_name,
+    'phone_number': normalize_phone,
+    'email_address': normalize_email,
+}
+
+def normalize(info):
+    """
+    Returns (record, errors). record is a copy of info with its fields
+    normalized, errors lists "field: reason" for every field that failed.
+    """
+    record = dict(info)
+    errors = []
+    for field, clean in CLEANERS.items():
+        try:
+            record[field] = clean(info.get(field, ''))
+        except ValueError as e:
+            errors.append(f"{field}: {e}")
+    for field in ('first_name', 'last_name'):
+        if not record[field]:
+            errors.append(f"{field}: empty")
+    return record, errors
+
+def normalize_chunk(records):
+    return [normalize(info) for info in records]
+
+def chunks(pairs, size):
+    pairs = iter(pairs)
+    while True:
+        chunk = list(islice(pairs, size))
+        if not chunk:
+            return
+        yield chunk
+
+def normalize_all(pairs, processes=None):
+    """
+    Takes (key, record) pairs and yields (key, record, normalized, errors)
+    in the same order. Once there are PARALLEL_AT records, chunks go to a
+    process pool with only a few in flight, so a stream never has to fit
+    in memory.
+    """
+    pairs = iter(pairs)
+    head = list(islice(pairs, PARALLEL_AT))
+    if len(head) < PARALLEL_AT:
+        for key, info in head:
+            yield (key, info, *normalize(info))
+        return
+    window = 2 * (processes or os.cpu_count() or 1)
+    with ProcessPoolExecutor(processes) as pool:
+        running = deque()
+        for chunk in chunks(chain(head, pairs), CHUNK_SIZE):
+            running.append((chunk, pool.submit(normalize_chunk, [info for _, info in chunk])))
+            while len(running) > window or (running and running[0][1].done()):
+                done, future = running.popleft()
+                for (key, info), result in zip(done, future.result()):
+                    yield (key, info, *result)
+        for done, future in running:
+            for (key, info), result in zip(done, future.result()):
+                yield (key, info, *result)
+
+
+class Report():
+    """
+    Counts what a normalization run did.
+
+    Attributes:
+    checked: int -- records seen
+    changed: int -- records that normalizing changed
+    failed: int -- records rejected
+    rejected: Counter -- how often each "field: reason" came up
+    examples: list -- (book_id, errors) for the first few rejected records
+    """
+    EXAMPLES = 10
+
+    def __init__(self):
+        self.checked = 0
+        self.changed = 0
+        self.failed = 0
+        self.rejected = Counter()
+        self.examples = []
+        self.start = time.perf_counter()
+
+    def add(self, book_id, info, record, errors):
+        self.checked += 1
+        if errors:
+            self.failed += 1
+            self.rejected.update(errors)
+            if len(self.examples) < self.EXAMPLES:
+                self.examples.append((book_id, errors))
+        elif record != info:
+            self.changed += 1
+
+    def summary(self):
+        elapsed = time.perf_counter() - self.start
+        rate = self.checked / elapsed if elapsed else 0
+        lines = [f"Checked {self.checked} records in {elapsed:.2f}s ({rate:.0f} records/sec), "
+                 f"{self.changed} changed, {self.failed} rejected"]
+        if self.rejected:
+            lines.append("Rejected:")
+            lines.extend(f"  {count:>8}  {reason}" for reason, count in self.rejected.most_common())
+            lines.append("For example:")
+            lines.extend(f"  {book_id}: {'; '.join(errors)}" for book_id, errors in self.examples)
+        return "\n".join(lines)
+
+
+def clean_rows(rows, report, processes=None):
+    # Used by bulk imports: yields the rows that pass, normalized
+    pairs = ((row.get('book_id') or f"row {number}", row) for number, row in enumerate(rows, 1))
+    for key, row, record, errors in normalize_all(pairs, processes):
+        report.add(key, row, record, errors)
+        if not errors:
+            yield record
+
+def normalize_store(store, apply=False, processes=None):
+    # Rejected records are reported and left as they are
+    report = Report()
+    pairs = ((book_id, store.get(book_id)) for book_id in store.ids())
+    records, ids = [], []
+    for book_id, info, record, errors in normalize_all(pairs, processes):
+        report.add(book_id, info, record, errors)
+        if apply and not errors and record != info:
+            records.append(record)
+            ids.append(book_id)
+            if len(records) >= BATCH_SIZE:
+                store.put_many(records, ids)
+                records, ids = [], []
+    if records:
+        store.put_many(records, ids)
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Normalize and validate the contacts in a store")
+    parser.add_argument('--store', choices=list(STORES), help="defaults to ADDRESS_BOOK_STORE, then shelve")
+    parser.add_argument('--apply', action='store_true', help="write the normalized records back")
+    parser.add_argument('--processes', type=int, help="worker processes, one per core by default")
+    args = parser.parse_args()
+
+    store = open_store(args.store)
+    try:
+        report = normalize_store(store, args.apply, args.processes)
+    finally:
+        store.close()
+    print(report.summary())
+
+if __name__ == "__main__":
+    main()
@@ -1,105 +1,180 @@
 # OOP 4.2 Serialization with pickles
 
+import os
 import pickle
+import sys
+import history
+import metrics
+from prefixindex import PrefixIndex
+from searchcache import SearchCache
+from snapshot import COMPRESSION as ENCODINGS, read_snapshot, replay_log, write_snapshot
 
-book = {}
-
-with open('book.pkl', 'wb') as f:
-    pickle.dump(book, f)
-
-def choice():
-    print("Address Book Menu:\n \
-1. Add New User\n \
-2. Search for Existing User\n \
-3. Change Existing User\n \
-4. Delete Existing User\n \
-5. Exit")
-    x = input("input: ")
-    if x == "1":
-        print("goto 1")
-        add()
-    elif x == "2":
-        print("goto 2")
-        search()
-    elif x == "3":
-        print("goto 3")
-        update()
-    elif x == "4":
-        print("goto 4")
-        delete()
-    else:
-        print("exit")
-
-def add():
-    count = 1
-    print("Please input First Name:")
-    fname = input("Input: ")
-    print("Please input Last Name:")
-    lname = input("Input: ")
-    print("Please input Phone Number:")
-    num = input("Input: ")
-    print("Please input Email:")
-    ema = input("Input: ")
-    book[f"book{count}"] = {f"First Name": fname, "Last Name": lname, "Number": num, "Email": ema}
-    count += 1
-
-    save()
-    choice()
-
-def search():
-    inp1 = input("Please Input the first name: ")
-    inp2 = input("Please Input the last name: ")
-    for book_id, info in book.items():
-        if info["First Name"].lower() == inp1.lower() and info["Last Name"].lower() == inp2.lower(): 
-            print(f"Found Address: {book_id}")
-            print(f"Address {info}")
-            return book_id
-    
-    print("No Address found.")
-    choice()
-    
-def update():
-    book_id = search()
-    print("What would you like to change")
-    x = input("input: ")
-    if x == "1":
-        print("name")
-        new_name = input("New Name: ")
-        book[book_id]["First Name"] = new_name
-    if x == "2":
-        print("lname")
-        new_lname = input("New Last Name: ")
-        book[book_id]["Last Name"] = new_lname
-    if x == "3":
-        print("phone")
-        new_phone = input("New Phone Number: ")
-        book[book_id]["Number"] = new_phone
-    if x == "4":
-        print("email")
-        new_email = input("New Email: ")
-        book[book_id]["Email"] = new_email
-    else:
-        print("exit")
+# In journal mode every change is appended to book.log instead of rewriting
+# book.pkl. The log is folded back into a fresh book.pkl every CHECKPOINT_EVERY changes
+BOOK_FILE = 'book.pkl'
+LOG_FILE = 'book.log'
+JOURNAL = True
+CHECKPOINT_EVERY = 100
+
+# Snapshot encoding. BOOK_COMPRESSION can be zlib, lzma or bz2 and is set
+# per deployment, snapshots in any encoding can always be read back
+PROTOCOL = pickle.HIGHEST_PROTOCOL
+COMPRESSION = os.environ.get('BOOK_COMPRESSION') or None
+if COMPRESSION not in ENCODINGS:
+    raise ValueError(f"BOOK_COMPRESSION={COMPRESSION} is not one of {', '.join(c for c in ENCODINGS if c)}")
+
+# Every checkpoint is kept as a version in history.HISTORY_DIR
+HISTORY = True
+
+# Recent name searches are answered without scanning the book, until a
+# change touches that name. SEARCH_CACHE_TTL is in seconds, None for no limit
+SEARCH_CACHE_SIZE = 1024
+SEARCH_CACHE_TTL = None
+
+pending = 0
+# Ids changed since the last checkpoint, saved as the next history delta
+changed = set()
+
+def load_book():
+    global pending
+    book = {}
+    if os.path.exists(BOOK_FILE):
+        with open(BOOK_FILE, 'rb') as f:
+            book = read_snapshot(f)
+    if os.path.exists(LOG_FILE):
+        with open(LOG_FILE, 'r+b') as f:
+            ids, good = replay_log(f, book)
+            changed.update(ids)
+            pending += len(ids)
+            # Cut off a half written entry left by a crash so new entries follow good ones
+            f.truncate(good)
+    return book
+
+book = load_book()
+prefixes = PrefixIndex(book, ["First Name", "Last Name", "Email"])
+results = SearchCache(SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL)
 
-    save()
+def new_id():
+    count = len(book) + 1
+    while f"book{count}" in book:
+        count += 1
+    return f"book{count}"
 
-    choice()
+def name_key(fname, lname):
+    return f"{fname.lower()}\t{lname.lower()}"
 
-def delete():
-    book_id = search()
-    inp1 = input(f"Are you sure you would like to delete {book_id}? (yes/no)")
-    if inp1 == "yes":
-        del book[book_id]
-    elif inp1 == "no":
-        choice()
+def forget(info):
+    # Drops the cached search for this contact's name
+    results.invalidate(name_key(info["First Name"], info["Last Name"]))
+
+@metrics.timed('pickle', 'search')
+def find(fname, lname):
+    # Returns the ids of every contact with this name
+    key = name_key(fname, lname)
+    ids = results.get(key)
+    if ids is None:
+        ids = [book_id for book_id, info in book.items()
+               if name_key(info["First Name"], info["Last Name"]) == key]
+        results.put(key, ids)
+    return ids
+
+@metrics.timed('pickle', lambda book_id, info: 'update' if book_id in book else 'add')
+def put(book_id, info):
+    if book_id in book:
+        prefixes.remove(book_id, book[book_id])
+        forget(book[book_id])
+    book[book_id] = info
+    prefixes.add(book_id, info)
+    forget(info)
+    save(book_id)
+    return book_id
+
+@metrics.timed('pickle', 'save_many')
+def put_many(records, ids=None):
+    # Adds several contacts with a single journal write. With ids the
+    # contacts are stored under those ids, replacing what is there
+    given = ids
+    ids = []
+    for i, info in enumerate(records):
+        book_id = given[i] if given else new_id()
+        if book_id in book:
+            prefixes.remove(book_id, book[book_id])
+            forget(book[book_id])
+        book[book_id] = info
+        prefixes.add(book_id, info)
+        forget(info)
+        ids.append(book_id)
+    if JOURNAL:
+        journal(ids)
     else:
-        print("Please type yes or no!")
-        delete()
+        changed.update(ids)
+        checkpoint()
+    return ids
+
+@metrics.timed('pickle', 'delete')
+def remove(book_id):
+    prefixes.remove(book_id, book[book_id])
+    forget(book[book_id])
+    del book[book_id]
+    save(book_id)
+
+def save(book_id=None):
+    if not JOURNAL or book_id is None:
+        if book_id is not None:
+            changed.add(book_id)
+        checkpoint()
+        return
+    journal([book_id])
+
+@metrics.timed('pickle', 'journal')
+def journal(book_ids):
+    global pending
+    with open(LOG_FILE, 'ab') as f:
+        start = f.tell()
+        for book_id in book_ids:
+            if book_id in book:
+                entry = ("set", book_id, book[book_id])
+            else:
+                entry = ("del", book_id, None)
+            pickle.dump(entry, f, protocol=PROTOCOL)
+        f.flush()
+        os.fsync(f.fileno())
+        metrics.written('pickle', 'journal', f.tell() - start)
+    pending += len(book_ids)
+    changed.update(book_ids)
+    if pending >= CHECKPOINT_EVERY:
+        checkpoint()
+
+@metrics.timed('pickle', 'checkpoint')
+def checkpoint():
+    # Write the new snapshot to a temp file and swap it in, so a crash
+    # leaves either the old snapshot plus log or the new snapshot
+    global pending
+    with open(BOOK_FILE + '.tmp', 'wb') as f:
+        write_snapshot(book, f, PROTOCOL, COMPRESSION)
+        f.flush()
+        os.fsync(f.fileno())
+        metrics.written('pickle', 'checkpoint', f.tell())
+    os.replace(BOOK_FILE + '.tmp', BOOK_FILE)
+    if HISTORY:
+        history.record(book, changed, PROTOCOL, COMPRESSION)
+    open(LOG_FILE, 'wb').close()
+    pending = 0
+    changed.clear()
 
-    save()
-    choice()
+def replace_book(contents):
+    # Makes an older version the current book, used by history restore
+    for book_id in set(book) | set(contents):
+        if book.get(book_id) != contents.get(book_id):
+            changed.add(book_id)
+    book.clear()
+    book.update(contents)
+    prefixes.entries = None
+    results.clear()
+    checkpoint()
 
-def save():
-    with open('book.pkl', 'wb') as f:
-        pickle.dump(book, f)
-choice()
\ No newline at end of file
+if __name__ == "__main__":
+    # The menu runs over this module, not a second import of it
+    from menu import choice
+    from storage import PickleStore
+    choice(PickleStore(sys.modules[__name__]))
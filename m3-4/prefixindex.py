@@ -0,0 +1,74 @@
+# OOP 4.2 Serialization with pickles
+
+from bisect import bisect_left, insort
+
+
+class PrefixIndex():
+    """
+    A sorted list of (term, book_id) pairs used to find contacts whose
+    name or email starts with a prefix.
+
+    The index is built from the book the first time it is searched, and
+    after that add() and remove() keep it up to date. When another process
+    may have written to the book, check() with the book's generation drops
+    the entries if it moved, and the next search builds them again.
+
+    Attributes:
+    book: dict -- the address book the index is built from
+    fields: list -- the record fields that are indexed
+    entries: list -- the sorted (term, book_id) pairs, None until built
+    generation: int -- the book generation the entries were built at
+
+    Methods:
+    add: Indexes a record
+    remove: Removes a record from the index
+    search: Returns up to k book ids whose terms start with a prefix
+    check: Drops the entries when the generation changed
+    """
+    def __init__(self, book, fields):
+        self.book = book
+        self.fields = fields
+        self.entries = None
+        self.generation = None
+
+    def terms(self, info):
+        return {info[field].lower() for field in self.fields if info.get(field)}
+
+    def build(self):
+        self.entries = sorted((term, book_id) for book_id, info in self.book.items()
+                              for term in self.terms(info))
+
+    def add(self, book_id, info):
+        if self.entries is None:
+            return
+        for term in self.terms(info):
+            insort(self.entries, (term, book_id))
+
+    def remove(self, book_id, info):
+        if self.entries is None:
+            return
+        for term in self.terms(info):
+            i = bisect_left(self.entries, (term, book_id))
+            if i < len(self.entries) and self.entries[i] == (term, book_id):
+                del self.entries[i]
+
+    def check(self, generation):
+        if generation != self.generation:
+            self.entries = None
+            self.generation = generation
+
+    def search(self, prefix, k=10):
+        if self.entries is None:
+            self.build()
+        prefix = prefix.lower()
+        # (prefix,) sorts just before every (term, book_id) starting with prefix
+        i = bisect_left(self.entries, (prefix,))
+        found = []
+        while i < len(self.entries) and len(found) < k:
+            term, book_id = self.entries[i]
+            if not term.startswith(prefix):
+                break
+            if book_id not in found:
+                found.append(book_id)
+            i += 1
+        return found
@@ -0,0 +1,117 @@
+# OOP 4.2 Serialization with pickles
+
+from bisect import bisect_left, bisect_right, insort
+from datetime import date, datetime, timedelta
+
+# Sorts after any real book id, so (key, LAST_ID) is past every entry for key
+LAST_ID = "\U0010ffff"
+
+
+def zip_key(value):
+    value = str(value).strip()[:5]
+    return value.zfill(5) if value.isdigit() else None
+
+def state_key(value):
+    return str(value).strip().upper() or None
+
+def birthday_key(value):
+    # Birthdays are ordered by (month, day) so a range is a part of the year
+    for layout in ("%m/%d/%Y", "%Y-%m-%d"):
+        try:
+            born = datetime.strptime(str(value).strip(), layout)
+            return (born.month, born.day)
+        except ValueError:
+            pass
+    return None
+
+
+class RangeIndex():
+    """
+    A sorted list of (key, book_id) pairs for one field, used for range
+    queries and ordered iteration.
+
+    Like PrefixIndex it is built from the book on first use, kept up to
+    date by add() and remove(), and dropped by check() when the book's
+    generation moved. Records without the field are skipped.
+
+    Attributes:
+    book: dict -- the address book the index is built from
+    field: str -- the record field that is indexed
+    key: function -- turns a field value into a sortable key, or None to skip it
+    entries: list -- the sorted (key, book_id) pairs, None until built
+    generation: int -- the book generation the entries were built at
+
+    Methods:
+    add: Indexes a record
+    remove: Removes a record from the index
+    range: Returns book ids with low <= key <= high in key order
+    check: Drops the entries when the generation changed
+    """
+    def __init__(self, book, field, key):
+        self.book = book
+        self.field = field
+        self.key = key
+        self.entries = None
+        self.generation = None
+
+    def _key(self, info):
+        value = info.get(self.field)
+        return None if value in (None, "") else self.key(value)
+
+    def build(self):
+        entries = []
+        for book_id, info in self.book.items():
+            key = self._key(info)
+            if key is not None:
+                entries.append((key, book_id))
+        entries.sort()
+        self.entries = entries
+
+    def add(self, book_id, info):
+        key = self._key(info)
+        if self.entries is None or key is None:
+            return
+        insort(self.entries, (key, book_id))
+
+    def remove(self, book_id, info):
+        key = self._key(info)
+        if self.entries is None or key is None:
+            return
+        i = bisect_left(self.entries, (key, book_id))
+        if i < len(self.entries) and self.entries[i] == (key, book_id):
+            del self.entries[i]
+
+    def check(self, generation):
+        if generation != self.generation:
+            self.entries = None
+            self.generation = generation
+
+    def range(self, low=None, high=None, limit=None, offset=0, reverse=False):
+        if self.entries is None:
+            self.build()
+        start = 0 if low is None else bisect_left(self.entries, (low,))
+        end = len(self.entries) if high is None else bisect_right(self.entries, (high, LAST_ID))
+        # Only the requested page is copied out of the list
+        if reverse:
+            end -= offset
+            if limit is not None:
+                start = max(start, end - limit)
+            found = reversed(self.entries[start:end]) if start < end else []
+        else:
+            start += offset
+            if limit is not None:
+                end = min(end, start + limit)
+            found = self.entries[start:end]
+        return [book_id for _, book_id in found]
+
+
+def birthdays_between(index, first, last):
+    # Handles ranges that run over new year, like Dec 28 to Jan 3
+    low, high = (first.month, first.day), (last.month, last.day)
+    if low <= high:
+        return index.range(low, high)
+    return index.range(low, None) + index.range(None, high)
+
+def birthdays_this_week(index, today=None):
+    today = today or date.today()
+    return birthdays_between(index, today, today + timedelta(days=6))
@@ -0,0 +1,85 @@
+# OOP 4.2 Serialization with pickles
+
+import time
+from collections import OrderedDict
+
+
+class SearchCache():
+    """
+    Remembers the book ids found for recent name searches.
+
+    Holds at most maxsize searches and drops the least recently used one
+    to make room. With a ttl a result is only used for that many seconds.
+    Writers call invalidate() with the names a change touched, so other
+    results stay cached. When another process may have written, check()
+    with the shelf generation drops everything if it moved.
+
+    Attributes:
+    maxsize: int -- how many searches are kept
+    ttl: float -- seconds a result stays valid, None for no limit
+    generation: int -- the shelf generation the results were read at
+    hits, misses, evictions, expirations, invalidations: int -- counters
+
+    Methods:
+    get: Returns the cached ids for a key, or None
+    put: Caches the ids for a key
+    invalidate: Drops the results for some keys
+    check: Drops everything when the generation changed
+    clear: Drops everything
+    stats: Returns the counters in a dict
+    """
+    def __init__(self, maxsize=1024, ttl=None, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = OrderedDict()
+        self.generation = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= self.clock():
+            del self.entries[key]
+            self.expirations += 1
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        # A copy, so callers cannot change what is cached
+        return list(entry[0])
+
+    def put(self, key, ids):
+        if self.maxsize <= 0:
+            return
+        expires = None if self.ttl is None else self.clock() + self.ttl
+        self.entries[key] = (tuple(ids), expires)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, *keys):
+        for key in keys:
+            if self.entries.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def check(self, generation):
+        if generation != self.generation:
+            self.clear()
+            self.generation = generation
+
+    def clear(self):
+        self.invalidations += len(self.entries)
+        self.entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {'size': len(self.entries), 'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0, 'evictions': self.evictions,
+                'expirations': self.expirations, 'invalidations': self.invalidations}
@@ -0,0 +1,214 @@
+# OOP 4.2 Serialization with pickles
+# A small HTTP/1.1 JSON API for the address book, stdlib only
+#
+# Usage:
+#   python server.py [--store shelve|pickle|sqlite] [--port 8080]
+#
+#   GET    /contacts?cursor=ID&limit=N     one page of contacts, sorted by id
+#   GET    /contacts/search?first=F&last=L contacts with this name
+#   GET    /contacts/ID                    one contact
+#   POST   /contacts                       add one contact, or a JSON list of them
+#   PUT    /contacts/ID                    replace a contact
+#   DELETE /contacts/ID                    delete a contact
+#   GET    /metrics                        operation metrics as Prometheus text,
+#                                          when ADDRESS_BOOK_METRICS is set
+#
+# Contacts use the shelve field names (first_name, last_name, phone_number,
+# email_address) whichever store is behind the server.
+# Connections are kept open between requests unless the client asks to close.
+# Store calls are short and run on the event loop itself.
+
+import argparse
+import asyncio
+import json
+import traceback
+from bisect import bisect_right, insort
+from http import HTTPStatus
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import metrics
+from bulk import FIELDS, OPTIONAL_FIELDS
+from normalize import normalize
+from storage import STORES, open_store
+
+MAX_LIMIT = 1000
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class AddressBookAPI():
+    """
+    Routes HTTP requests to a store.
+
+    Attributes:
+    store: a store from storage.py -- where contacts are kept
+    ids: list -- every book id in sorted order, used for cursor pagination
+    generation: the store's generation when ids was read
+    """
+    def __init__(self, store):
+        self.store = store
+        self.ids = None
+        self.generation = None
+
+    def sorted_ids(self):
+        # Read again whenever another process wrote to the store
+        generation = self.store.generation()
+        if self.ids is None or generation != self.generation:
+            self.ids = sorted(self.store.ids())
+            self.generation = generation
+        return self.ids
+
+    def record(self, body):
+        if not isinstance(body, dict) or not body.get('first_name') or not body.get('last_name'):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "first_name and last_name are required")
+        info = {field: str(body.get(field, '')) for field in FIELDS}
+        info.update({field: str(body[field]) for field in OPTIONAL_FIELDS if body.get(field)})
+        info, errors = normalize(info)
+        if errors:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "; ".join(errors))
+        return info
+
+    def added(self, book_id):
+        ids = self.sorted_ids()
+        i = bisect_right(ids, book_id)
+        if not (i and ids[i - 1] == book_id):
+            insort(ids, book_id)
+
+    def handle(self, method, target, body):
+        url = urlsplit(target)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        parts = [unquote(p) for p in url.path.strip('/').split('/')]
+        if parts == ['metrics'] and method == 'GET':
+            if not metrics.ENABLED:
+                raise HTTPError(HTTPStatus.NOT_FOUND, "metrics are off, set ADDRESS_BOOK_METRICS")
+            # Text, not JSON, so Prometheus can scrape it
+            return HTTPStatus.OK, metrics.to_prometheus()
+        if parts[0] != 'contacts' or len(parts) > 2:
+            raise HTTPError(HTTPStatus.NOT_FOUND, "no such path")
+
+        if len(parts) == 1 and method == 'GET':
+            try:
+                limit = min(int(query.get('limit', 100)), MAX_LIMIT)
+            except ValueError:
+                raise HTTPError(HTTPStatus.BAD_REQUEST, "limit must be a number")
+            if limit < 1:
+                raise HTTPError(HTTPStatus.BAD_REQUEST, "limit must be at least 1")
+            ids = self.sorted_ids()
+            start = bisect_right(ids, query['cursor']) if 'cursor' in query else 0
+            page = ids[start:start + limit]
+            # A contact deleted since the ids were read is left out
+            found = ((book_id, self.store.get(book_id)) for book_id in page)
+            contacts = [{'book_id': book_id, **info} for book_id, info in found if info is not None]
+            cursor = page[-1] if start + limit < len(ids) and page else None
+            return HTTPStatus.OK, {'contacts': contacts, 'next_cursor': cursor}
+
+        if len(parts) == 1 and method == 'POST':
+            if isinstance(body, list):
+                ids = self.store.put_many([self.record(item) for item in body])
+            else:
+                ids = [self.store.put(None, self.record(body))]
+            for book_id in ids:
+                self.added(book_id)
+            return HTTPStatus.CREATED, {'book_ids': ids}
+
+        if len(parts) == 1:
+            raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED, f"{method} not allowed here")
+
+        if parts[1] == 'search' and method == 'GET':
+            ids = self.store.find(query.get('first', ''), query.get('last', ''))
+            # An id can outlive its contact in a stale index, those are skipped
+            found = ((i, self.store.get(i)) for i in ids)
+            return HTTPStatus.OK, {'contacts': [{'book_id': i, **info} for i, info in found if info is not None]}
+
+        book_id = parts[1]
+        info = self.store.get(book_id)
+        if info is None:
+            raise HTTPError(HTTPStatus.NOT_FOUND, f"no contact {book_id}")
+        if method == 'GET':
+            return HTTPStatus.OK, {'book_id': book_id, **info}
+        if method == 'PUT':
+            self.store.put(book_id, self.record(body))
+            return HTTPStatus.OK, {'book_id': book_id}
+        if method == 'DELETE':
+            self.store.remove(book_id)
+            ids = self.sorted_ids()
+            i = bisect_right(ids, book_id) - 1
+            if i >= 0 and ids[i] == book_id:
+                del ids[i]
+            return HTTPStatus.OK, {'book_id': book_id}
+        raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED, f"{method} not allowed here")
+
+    async def serve_client(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, version = request_line.decode('latin-1').split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get('content-length', 0))
+                raw = await reader.readexactly(length) if length else b''
+
+                try:
+                    try:
+                        body = json.loads(raw) if raw else None
+                    except ValueError:
+                        raise HTTPError(HTTPStatus.BAD_REQUEST, "body is not valid JSON")
+                    status, result = self.handle(method, target, body)
+                except HTTPError as e:
+                    status, result = e.status, {'error': str(e)}
+                except KeyError as e:
+                    # The contact went away between the lookup and the change
+                    status, result = HTTPStatus.NOT_FOUND, {'error': f"no contact {e.args[0]}"}
+                except Exception:
+                    # A failed request must not take the connection down with it
+                    traceback.print_exc()
+                    status, result = HTTPStatus.INTERNAL_SERVER_ERROR, {'error': "internal error"}
+
+                keep_alive = headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+                if isinstance(result, str):
+                    data, content_type = result.encode(), 'text/plain; version=0.0.4'
+                else:
+                    data, content_type = json.dumps(result).encode(), 'application/json'
+                writer.write(f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+                             f"Content-Type: {content_type}\r\n"
+                             f"Content-Length: {len(data)}\r\n"
+                             f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Serve the address book over HTTP")
+    parser.add_argument('--store', choices=list(STORES),
+                        help="defaults to ADDRESS_BOOK_STORE, then shelve")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    args = parser.parse_args()
+
+    api = AddressBookAPI(open_store(args.store))
+    server = await asyncio.start_server(api.serve_client, args.host, args.port)
+    print(f"Serving the {type(api.store).__name__} address book on http://{args.host}:{args.port}")
+    async with server:
+        await server.serve_forever()
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
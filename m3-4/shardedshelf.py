@@ -0,0 +1,323 @@
+# OOP 4.2 Serialization with pickles
+# Spreads the address book over several shelf files
+#
+# Usage:
+#   python shardedshelf.py reshard address_book FROM TO
+#
+# Moves every record from FROM shards to TO shards. 1 means the plain
+# unsharded shelf. If it is interrupted, run the same command again.
+
+import argparse
+import glob
+import hashlib
+import multiprocessing
+import os
+import re
+import shutil
+from collections import ChainMap
+from collections.abc import MutableMapping
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack, contextmanager
+
+from compact import finish_swap, shelf_files
+from lazyshelf import LazyShelf
+from shelflock import ShelfLock, open_db, open_shelf
+
+
+# Written into the staging directory once the new shards are complete
+RESHARD_DONE = 'DONE'
+
+
+def shard_name(filename, shard, shards):
+    return f"{filename}.{shard:02d}-of-{shards:02d}"
+
+def shard_of(key, shards):
+    # hash() on strings changes between runs, the shard has to stay put
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=4).digest(), 'little') % shards
+
+def other_counts(filename, count):
+    # Shard counts other than count that have files on disk
+    pattern = re.compile(re.escape(filename) + r"\.\d+-of-(\d+)")
+    found = {int(match.group(1)) for match in map(pattern.match, glob.glob(glob.escape(filename) + '.*-of-*'))
+             if match}
+    return found - {count}
+
+def pool_context():
+    # Forked workers do not import the caller's __main__ again, which for
+    # shelvecrud would open the book and wait on the lock the caller holds
+    if 'fork' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('fork')
+    return multiprocessing.get_context()
+
+def read_shard(filename):
+    # Runs in a worker process, so it opens the shard on its own
+    lock = ShelfLock(filename + '.lock')
+    try:
+        with lock.shared(), open_shelf(filename, 'r') as db:
+            return dict(db)
+    finally:
+        lock.close()
+
+
+class ShardedShelf(MutableMapping):
+    """
+    A LazyShelf split over several shelf files by a hash of the book id.
+
+    Reading or writing one record only opens and locks the shard it lives
+    in, so each file stays small and processes working on different
+    shards do not wait for each other. writing() and reading() take a lock
+    over the whole book for callers that also keep other files in step
+    with it, like the name index. Inside writing() a shard takes its own
+    writer lock the first time it is written and keeps it until the block
+    ends. The book's generation is bumped only if a shard was written.
+
+    items() and load() read every shard at once in a process pool.
+
+    Attributes:
+    filename: str -- the name the shard files are based on
+    shards: list -- one LazyShelf per shard
+    lock: ShelfLock -- the lock over the whole book
+    generation: int -- the book lock's generation when last read or written
+    changed: bool -- set to bump the generation even if no shard was written
+    processes: int -- worker processes for full scans, None for one per core
+
+    Methods:
+    reading: Context manager holding the shared book lock, yields the book
+    writing: Context manager holding the exclusive book lock, yields the book
+    load: Returns every record in a dict, reading the shards in parallel
+    sync: Writes pending changes to disk while writing
+    close: Closes every shard
+    """
+    def __init__(self, filename, count, cache_size=1024, timeout=10.0, processes=None):
+        # Opening with another count would quietly miss records in the old shards
+        others = other_counts(filename, count)
+        if others:
+            raise ValueError(f"{filename} has {sorted(others)} shards on disk, "
+                             f"reshard it to {count} first")
+        self.filename = filename
+        self.shards = [LazyShelf(shard_name(filename, shard, count), cache_size, timeout)
+                       for shard in range(count)]
+        self.lock = ShelfLock(filename + '.lock', timeout)
+        self.processes = processes
+        self.generation = None
+        self.changed = False
+        self.writer = None
+        self.reader = False
+
+    @property
+    def filenames(self):
+        return [shard.filename for shard in self.shards]
+
+    @property
+    def dirty(self):
+        # A live view over the shards' own dicts, nothing is copied
+        return ChainMap(*(shard.dirty for shard in self.shards))
+
+    @contextmanager
+    def reading(self):
+        if self.writer is not None or self.reader:
+            yield self
+            return
+        with self.lock.shared():
+            # The shards of an import that died while swapping them in
+            finish_swap(self.filename)
+            self.generation = self.lock.generation()
+            self.reader = True
+            try:
+                yield self
+            finally:
+                self.reader = False
+
+    @contextmanager
+    def writing(self):
+        if self.writer is not None:
+            yield self
+            return
+        # The open shards are closed before the book lock is let go
+        with self.lock.exclusive(), ExitStack() as opened:
+            finish_swap(self.filename)
+            self.writer = opened
+            try:
+                yield self
+            finally:
+                self.writer = None
+                # The shards that were written are still open here
+                if self.changed or any(shard.changed for shard in self.shards):
+                    self.generation = self.lock.bump()
+                    self.changed = False
+
+    def _shard(self, key, write=False):
+        shard = self.shards[shard_of(key, len(self.shards))]
+        if write and self.writer is not None and not shard.writer:
+            self.writer.enter_context(shard.writing())
+        return shard
+
+    def __getitem__(self, key):
+        return self._shard(key)[key]
+
+    def __setitem__(self, key, value):
+        self._shard(key, True)[key] = value
+
+    def __delitem__(self, key):
+        del self._shard(key, True)[key]
+
+    def __contains__(self, key):
+        return key in self._shard(key)
+
+    def __iter__(self):
+        return iter([key for shard in self.shards for key in shard])
+
+    def __len__(self):
+        return sum(len(shard) for shard in self.shards)
+
+    def load(self):
+        book = {}
+        with ProcessPoolExecutor(self.processes, mp_context=pool_context()) as pool:
+            for records in pool.map(read_shard, self.filenames):
+                book.update(records)
+        # Edits not written back yet win over what is on disk
+        book.update(self.dirty)
+        return book
+
+    def items(self):
+        return self.load().items()
+
+    def sync(self):
+        for shard in self.shards:
+            shard.sync()
+
+    def close(self):
+        for shard in self.shards:
+            shard.close()
+        self.lock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def open_book(filename, count, **options):
+    if os.path.exists(os.path.join(staging_dir(filename), RESHARD_DONE)):
+        raise ValueError(f"a reshard of {filename} was interrupted, run it again to finish it")
+    if count > 1:
+        return ShardedShelf(filename, count, **options)
+    if other_counts(filename, 1):
+        raise ValueError(f"{filename} has {sorted(other_counts(filename, 1))} shards on disk, "
+                         f"set ADDRESS_BOOK_SHARDS or reshard it to 1 first")
+    return LazyShelf(filename, **options)
+
+def book_names(filename, count):
+    return [filename] if count <= 1 else [shard_name(filename, shard, count) for shard in range(count)]
+
+def counts_on_disk(filename):
+    return other_counts(filename, 1) | ({1} if shelf_files(filename) else set())
+
+def staging_dir(filename):
+    return filename + '.reshard'
+
+def sync_path(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def finish_reshard(filename):
+    # Moves a complete staged copy into place, then removes the files it
+    # replaces. Each step can be done again, so a crash part way through
+    # is finished by the next run
+    staging = staging_dir(filename)
+    with open(os.path.join(staging, RESHARD_DONE)) as f:
+        old_count, new_count = map(int, f.read().split())
+    folder = os.path.dirname(filename) or '.'
+    for name in os.listdir(staging):
+        if name != RESHARD_DONE:
+            os.replace(os.path.join(staging, name), os.path.join(folder, name))
+    sync_path(folder)
+    for name in book_names(filename, old_count):
+        for path in shelf_files(name):
+            os.remove(path)
+        # The unsharded shelf's lock is also the lock over a sharded book
+        if old_count > 1 and os.path.exists(name + '.lock'):
+            os.remove(name + '.lock')
+    os.remove(os.path.join(staging, RESHARD_DONE))
+    os.rmdir(staging)
+
+def reshard(filename, old_count, new_count):
+    """
+    Moves every record from old_count shards to new_count shards and
+    returns how many were moved, or None when the book already has
+    new_count shards.
+
+    The book's writer lock is held throughout, so nothing is written
+    meanwhile. The new shards are written to a staging directory and only
+    moved into place once complete, after a marker file says so. Running
+    it again after a crash finishes an interrupted swap, or drops an
+    unfinished copy and starts over, while the old files are still there.
+    """
+    if old_count == new_count:
+        return None
+    staging = staging_dir(filename)
+    lock = ShelfLock(filename + '.lock')
+    try:
+        with lock.exclusive():
+            if os.path.exists(os.path.join(staging, RESHARD_DONE)):
+                finish_reshard(filename)
+                lock.bump()
+            elif os.path.isdir(staging):
+                shutil.rmtree(staging)
+            on_disk = counts_on_disk(filename)
+            if on_disk == {new_count}:
+                return None
+            if on_disk - {old_count}:
+                raise ValueError(f"{filename} has {sorted(on_disk)} shards on disk, not {old_count}")
+
+            # Raw pickled records are copied, nothing gets unpickled
+            os.mkdir(staging)
+            names = [os.path.join(staging, os.path.basename(name)) for name in book_names(filename, new_count)]
+            shards = [open_db(name, 'n') for name in names]
+            moved = 0
+            try:
+                for name in book_names(filename, old_count):
+                    if not shelf_files(name):
+                        continue
+                    with open_db(name, 'r') as old:
+                        for key in old.keys():
+                            shards[shard_of(key.decode('utf-8'), len(shards))][key] = old[key]
+                            moved += 1
+            finally:
+                for shard in shards:
+                    shard.close()
+            for name in os.listdir(staging):
+                sync_path(os.path.join(staging, name))
+            with open(os.path.join(staging, RESHARD_DONE), 'w') as f:
+                f.write(f"{old_count} {new_count}\n")
+                f.flush()
+                os.fsync(f.fileno())
+            sync_path(staging)
+
+            finish_reshard(filename)
+            # Other processes reopen the book when they see a new generation
+            lock.bump()
+            return moved
+    finally:
+        lock.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Change how many shards the shelve address book uses")
+    commands = parser.add_subparsers(dest='command', required=True)
+    reshard_parser = commands.add_parser('reshard')
+    reshard_parser.add_argument('filename')
+    reshard_parser.add_argument('old_count', type=int)
+    reshard_parser.add_argument('new_count', type=int)
+    args = parser.parse_args()
+    moved = reshard(args.filename, args.old_count, args.new_count)
+    if moved is None:
+        print(f"{args.filename} already has {args.new_count} shards")
+    else:
+        print(f"Moved {moved} records from {args.old_count} to {args.new_count} shards")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+# OOP 4.2 Serialization with pickles
+# A read only address book in shared memory for many worker processes
+#
+# Usage:
+#   python sharedbook.py publish [--store shelve|pickle|sqlite] [--every SECONDS]
+#   python sharedbook.py show [BOOK_ID]
+#
+# One loader process reads the store and publishes it as an immutable
+# snapshot in a multiprocessing.shared_memory segment. Workers open a
+# SharedBook and look contacts up by id or name, or iterate over them,
+# straight from the shared pages, so the book is in memory once however
+# many workers there are. Records are decoded only when they are read.
+#
+# A snapshot segment holds:
+#   header   "SHB1", size of the book (uint64)
+#   book     the mmapbook.py layout, sorted by book id, shelve field names
+#   names    one uint32 record number per record, sorted by last then first
+#            name in lower case, for find()
+#
+# A small control segment holds the generation of the current snapshot,
+# which is also part of the snapshot's segment name. The loader publishes
+# again every --every seconds or on SIGHUP: it builds the new segment,
+# bumps the generation and unlinks the old one. Workers keep reading the
+# snapshot they have until they call refresh(), which moves them to the
+# current one. Everything is unlinked when the loader stops.
+
+import argparse
+import io
+import os
+import signal
+import struct
+import sys
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+
+from mmapbook import BookView, dump_book
+from shardedshelf import pool_context
+from snapshot import read_book
+from storage import COLUMNS, DEFAULT_STORE, STORES, from_pickle, open_store
+
+SHARED_NAME = 'address_book'
+
+CONTROL = struct.Struct("<4sQ")
+CONTROL_MAGIC = b"SHBC"
+SEGMENT = struct.Struct("<4sQ")
+SEGMENT_MAGIC = b"SHB1"
+
+# How often the loader looks for SIGHUP and stop signals, in seconds
+TICK = 0.2
+
+
+def control_name(name):
+    return f"{name}.control"
+
+def segment_name(name, generation):
+    return f"{name}.{generation}"
+
+def name_key(info):
+    return (info['last_name'].lower(), info['first_name'].lower())
+
+# Before Python 3.13 every segment a process opens is unlinked when it
+# exits, which would take the snapshot away from everyone else
+UNTRACK = sys.version_info < (3, 13)
+
+def attach(name, create=False, size=0):
+    if not UNTRACK:
+        return shared_memory.SharedMemory(name, create, size, track=False)
+    shm = shared_memory.SharedMemory(name, create, size)
+    resource_tracker.unregister(shm._name, 'shared_memory')
+    return shm
+
+def destroy(shm):
+    shm.close()
+    if UNTRACK:
+        # unlink() takes it off the tracker again
+        resource_tracker.register(shm._name, 'shared_memory')
+    shm.unlink()
+
+def read_store(store_name):
+    """
+    Returns the sorted ids of the store and a function that gets one
+    record. Nothing is written to the store. The pickle book is read from
+    its files directly: loading it through picklecrud would cut off a log
+    entry that a writer is still appending.
+    """
+    if (store_name or os.environ.get('ADDRESS_BOOK_STORE') or DEFAULT_STORE) == 'pickle':
+        book = read_book()
+        return sorted(book), lambda book_id: from_pickle(book[book_id])
+    # Left open, the process ends when the segment is built
+    store = open_store(store_name)
+    return sorted(store.ids()), store.get
+
+def build_segment(name, generation, store_name):
+    """
+    Reads the store named store_name and writes it to a new snapshot
+    segment. Returns the number of records. Runs in a fresh worker process,
+    so the store is read as it is on disk now.
+    """
+    ids, get = read_store(store_name)
+    keys = []
+
+    def records():
+        for book_id in ids:
+            info = get(book_id)
+            keys.append(name_key(info))
+            yield info
+
+    book = io.BytesIO()
+    dump_book(book, ids, records(), COLUMNS)
+    size = book.tell()
+    # The name table starts on an 8 byte boundary
+    start = SEGMENT.size + size + -size % 8
+    names = array("I", sorted(range(len(ids)), key=keys.__getitem__)).tobytes()
+
+    shm = attach(segment_name(name, generation), create=True, size=start + len(names))
+    try:
+        SEGMENT.pack_into(shm.buf, 0, SEGMENT_MAGIC, size)
+        shm.buf[SEGMENT.size:SEGMENT.size + size] = book.getbuffer()
+        shm.buf[start:start + len(names)] = names
+    except BaseException:
+        destroy(shm)
+        raise
+    shm.close()
+    return len(ids)
+
+
+class SharedBook(BookView):
+    """
+    A read only dict-like view of the snapshot the loader published.
+
+    Attributes:
+    name: str -- the name the loader publishes under
+    generation: int -- the generation of the snapshot being read
+    names: memoryview -- record numbers in name order
+
+    Methods:
+    find: Returns the ids of the contacts with a name, any case
+    refresh: Moves to the current snapshot if there is a newer one
+    close: Lets go of the snapshot
+    """
+    def __init__(self, name=SHARED_NAME):
+        self.name = name
+        self.segment = None
+        try:
+            self.control = attach(control_name(name))
+        except FileNotFoundError:
+            raise FileNotFoundError(f"no address book is published as {name}, "
+                                    "start python sharedbook.py publish") from None
+        self._open(self.current())
+
+    def current(self):
+        magic, generation = CONTROL.unpack_from(self.control.buf, 0)
+        if magic != CONTROL_MAGIC:
+            raise ValueError(f"{control_name(self.name)} is not an address book control segment")
+        return generation
+
+    def _open(self, generation):
+        while True:
+            try:
+                segment = attach(segment_name(self.name, generation))
+                break
+            except FileNotFoundError:
+                # The loader swapped snapshots between reading the generation and opening it
+                latest = self.current()
+                if latest == generation:
+                    raise
+                generation = latest
+        magic, size = SEGMENT.unpack_from(segment.buf, 0)
+        if magic != SEGMENT_MAGIC:
+            segment.close()
+            raise ValueError(f"{segment_name(self.name, generation)} is not an address book snapshot")
+        self.segment = segment
+        self.generation = generation
+        super().__init__(segment.buf[SEGMENT.size:SEGMENT.size + size], segment_name(self.name, generation))
+        start = SEGMENT.size + size + -size % 8
+        self.names = segment.buf[start:start + array("I").itemsize * self.count].cast("I")
+
+    def _release(self):
+        # Views into the segment have to go before it can be closed
+        self.names.release()
+        self.map.release()
+        self.segment.close()
+        self.segment = None
+
+    def find(self, first, last):
+        target = (last.lower(), first.lower())
+        low, high = 0, self.count
+        while low < high:
+            mid = (low + high) // 2
+            if name_key(self.record(self.names[mid])[1]) < target:
+                low = mid + 1
+            else:
+                high = mid
+        ids = []
+        while low < self.count:
+            book_id, info = self.record(self.names[low])
+            if name_key(info) != target:
+                break
+            ids.append(book_id)
+            low += 1
+        return ids
+
+    def refresh(self):
+        """
+        Moves to the current snapshot and returns True, or returns False
+        when this one is still current. Records already read stay valid.
+        """
+        generation = self.current()
+        if generation == self.generation:
+            return False
+        self._release()
+        self._open(generation)
+        return True
+
+    def close(self):
+        if self.segment is not None:
+            self._release()
+        self.control.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def unlink(name):
+    try:
+        destroy(attach(name))
+    except FileNotFoundError:
+        pass
+
+def publish(name=SHARED_NAME, store_name=None, every=None, out=sys.stderr):
+    """
+    Publishes the store as name and keeps it published, again every every
+    seconds or on SIGHUP, until the process gets SIGINT or SIGTERM.
+    """
+    signals = {'reload': False, 'stop': False}
+
+    def reload(signum, frame):
+        signals['reload'] = True
+
+    def stop(signum, frame):
+        signals['stop'] = True
+
+    signal.signal(signal.SIGHUP, reload)
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    try:
+        # Carry on from a loader that died without cleaning up, so workers
+        # never see the generation go back
+        control = attach(control_name(name))
+    except FileNotFoundError:
+        control = attach(control_name(name), create=True, size=CONTROL.size)
+        CONTROL.pack_into(control.buf, 0, CONTROL_MAGIC, 0)
+    generation = CONTROL.unpack_from(control.buf, 0)[1]
+    published = None
+    try:
+        while not signals['stop']:
+            start = time.perf_counter()
+            # Left behind if a builder was killed part way
+            unlink(segment_name(name, generation + 1))
+            # A new process every time, so the store is read from disk and
+            # the loader itself never holds the book
+            try:
+                with ProcessPoolExecutor(1, mp_context=pool_context()) as pool:
+                    count = pool.submit(build_segment, name, generation + 1, store_name).result()
+            except Exception as e:
+                if published is None:
+                    raise
+                # Workers keep the snapshot they have, try again next time
+                print(f"Could not publish generation {generation + 1}, still serving "
+                      f"generation {published}: {e!r}", file=out)
+            else:
+                generation += 1
+                CONTROL.pack_into(control.buf, 0, CONTROL_MAGIC, generation)
+                if published is not None:
+                    unlink(segment_name(name, published))
+                published = generation
+                print(f"Published generation {generation}: {count} records in "
+                      f"{time.perf_counter() - start:.2f}s", file=out)
+
+            signals['reload'] = False
+            deadline = time.monotonic() + every if every else None
+            while not signals['stop'] and not signals['reload']:
+                if deadline is not None and time.monotonic() >= deadline:
+                    break
+                time.sleep(TICK)
+    finally:
+        if published is not None:
+            unlink(segment_name(name, published))
+        destroy(control)
+
+def main():
+    parser = argparse.ArgumentParser(description="Share a read only address book between processes")
+    parser.add_argument('--name', default=SHARED_NAME, help="shared memory name")
+    commands = parser.add_subparsers(dest='command', required=True)
+    publish_parser = commands.add_parser('publish', help="load a store and keep it published")
+    publish_parser.add_argument('--store', choices=list(STORES), help="defaults to ADDRESS_BOOK_STORE, then shelve")
+    publish_parser.add_argument('--every', type=float, help="publish again every this many seconds")
+    show_parser = commands.add_parser('show', help="print what is published")
+    show_parser.add_argument('book_id', nargs='?')
+    args = parser.parse_args()
+
+    if args.command == 'publish':
+        publish(args.name, args.store, args.every)
+        return
+    with SharedBook(args.name) as book:
+        if args.book_id is None:
+            print(f"Generation {book.generation}: {len(book)} records, {book.segment.size} bytes")
+        elif args.book_id in book:
+            print(book[args.book_id])
+        else:
+            print(f"No contact {args.book_id}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+# OOP 4.2 Serialization with pickles
+
+import dbm
+import fcntl
+import os
+import shelve
+import time
+from contextlib import contextmanager
+
+
+class LockTimeout(Exception):
+    pass
+
+
+class ShelfLock():
+    """
+    A reader/writer lock shared by every process using the same shelf.
+
+    Any number of processes can hold the shared lock, the exclusive lock
+    is held by one process at a time. Waiting for either gives up with
+    LockTimeout after timeout seconds.
+
+    Two byte range locks are used on the lock file. A writer first closes
+    the gate so no new readers get in, then waits for the readers already
+    inside, so a steady stream of readers cannot starve it.
+
+    The lock file also holds a generation number that writers bump, so
+    readers can tell when the shelf changed under them.
+    """
+    GATE = 8
+    DATA = 9
+
+    def __init__(self, path, timeout=10.0):
+        self.path = path
+        self.timeout = timeout
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o666)
+
+    def _lock(self, byte, kind, deadline):
+        delay = 0.001
+        while True:
+            try:
+                fcntl.lockf(self.fd, kind | fcntl.LOCK_NB, 1, byte)
+                return
+            except OSError:
+                if time.monotonic() >= deadline:
+                    raise LockTimeout(f"Timed out after {self.timeout}s waiting for {self.path}")
+                time.sleep(delay)
+                delay = min(delay * 2, 0.05)
+
+    def _unlock(self, byte):
+        fcntl.lockf(self.fd, fcntl.LOCK_UN, 1, byte)
+
+    @contextmanager
+    def shared(self):
+        deadline = time.monotonic() + self.timeout
+        self._lock(self.GATE, fcntl.LOCK_SH, deadline)
+        try:
+            self._lock(self.DATA, fcntl.LOCK_SH, deadline)
+        finally:
+            self._unlock(self.GATE)
+        try:
+            yield
+        finally:
+            self._unlock(self.DATA)
+
+    @contextmanager
+    def exclusive(self):
+        deadline = time.monotonic() + self.timeout
+        self._lock(self.GATE, fcntl.LOCK_EX, deadline)
+        try:
+            self._lock(self.DATA, fcntl.LOCK_EX, deadline)
+            try:
+                yield
+            finally:
+                self._unlock(self.DATA)
+        finally:
+            self._unlock(self.GATE)
+
+    def generation(self):
+        data = os.pread(self.fd, 8, 0)
+        return int.from_bytes(data, 'little') if len(data) == 8 else 0
+
+    def bump(self):
+        # Only call this while holding the exclusive lock
+        generation = self.generation() + 1
+        os.pwrite(self.fd, generation.to_bytes(8, 'little'), 0)
+        return generation
+
+    def close(self):
+        os.close(self.fd)
+
+
+def open_db(filename, flag='c'):
+    # Finish a compaction or import that crashed while swapping its copy
+    # in, the .dir and .dat files would not match until then
+    if os.path.exists(filename + '.swap'):
+        from compact import finish_swap
+        finish_swap(filename)
+    # gdbm takes its own lock on open, which would stop readers and the
+    # writer sharing the file. ShelfLock does the locking, so turn it off
+    if dbm.whichdb(filename) == 'dbm.gnu':
+        flag += 'u'
+    return dbm.open(filename, flag)
+
+def open_shelf(filename, flag='c'):
+    return shelve.Shelf(open_db(filename, flag))
+
+def sync_shelf(shelf):
+    # Writes out what the shelf holds in memory. dbm.dumb then still counts
+    # itself as modified and would write its index again on close, over
+    # whatever another process wrote meanwhile, so it is marked clean
+    shelf.sync()
+    db = shelf.dict
+    if hasattr(db, '_modified'):
+        db._modified = False
@@ -1,13 +1,127 @@
 # OOP 4.2 Serialization with pickles
 
+import os
+import pickle
 import shelve
+import sys
+from contextlib import contextmanager
+import metrics
+from compact import compact, shelf_files
+from prefixindex import PrefixIndex
+from rangeindex import RangeIndex, birthday_key, birthdays_this_week, state_key, zip_key
+from searchcache import SearchCache
+from shardedshelf import open_book
+from shelflock import open_shelf, sync_shelf
+
+# The name index lives in its own shelf next to the address book.
+# It maps a normalized "first<TAB>last" key to the list of book ids with that name
+INDEX_FILE = 'address_book_index'
+
+# Compact the shelf on exit once this share of it is dead space, None turns it off
+AUTO_COMPACT = 0.5
+
+# ADDRESS_BOOK_SHARDS splits the book over that many shelf files by a hash
+# of the book id. Change it on an existing book with shardedshelf.py reshard
+SHARDS = int(os.environ.get('ADDRESS_BOOK_SHARDS') or 1)
+
+# Recent name searches are answered without opening the name index. A
+# result is dropped when a write changes that name, or when another
+# process writes to the book. SEARCH_CACHE_TTL is in seconds, None for no limit
+SEARCH_CACHE_SIZE = 1024
+SEARCH_CACHE_TTL = None
+results = SearchCache(SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL)
+
+# The name index stays open like the book. Opening a dbm.dumb shelf reads
+# its whole .dir file, so it is only reopened when another process wrote
+# to the book. The book's lock covers the index too
+index = None
+index_writable = False
+index_generation = None
 
 
 def load_address_book():
-    with shelve.open('address_book') as db:
-        return dict(db)
+    # Records are unpickled when first used instead of all at startup
+    return open_book('address_book', SHARDS)
+
+def name_key(fname, lname):
+    # Normalize names the same way search() compares them
+    return f"{fname.lower()}\t{lname.lower()}"
+
+def index_add(index, book_id, info):
+    key = name_key(info['first_name'], info['last_name'])
+    results.invalidate(key)
+    ids = index.get(key, [])
+    if book_id not in ids:
+        ids.append(book_id)
+    index[key] = ids
+
+def index_remove(index, book_id, info):
+    key = name_key(info['first_name'], info['last_name'])
+    results.invalidate(key)
+    ids = [i for i in index.get(key, []) if i != book_id]
+    if ids:
+        index[key] = ids
+    elif key in index:
+        del index[key]
+
+def open_index(generation, write=False):
+    # The open name index, reopened if the book generation moved or it has
+    # to be writable and is not. Call it holding the book's lock
+    global index, index_writable, index_generation
+    if index is not None and generation == index_generation and (index_writable or not write):
+        return index
+    if index is not None:
+        index.close()
+    index = open_shelf(INDEX_FILE, 'c' if write or index_writable else 'r')
+    index_writable = write or index_writable
+    index_generation = generation
+    return index
+
+@contextmanager
+def writing_index():
+    # Holds the book's writer lock with the name index open for writing
+    with address_book.writing():
+        # Cached results are stale if another process wrote since they were read
+        generation = address_book.lock.generation()
+        results.check(generation)
+        prefixes.check(generation)
+        for by_field in ranges.values():
+            by_field.check(generation)
+        try:
+            yield open_index(generation, write=True)
+        finally:
+            # On disk before other processes can read it
+            sync_shelf(index)
+    # Our own write does not make the index or the rest of the cache stale
+    global index_generation
+    index_generation = address_book.generation
+    results.generation = address_book.generation
+    prefixes.generation = address_book.generation
+    for by_field in ranges.values():
+        by_field.generation = address_book.generation
+
+def build_index():
+    # Books saved before the index existed get indexed once on startup.
+    # Usually there is nothing to do, and the writer lock is not taken
+    with address_book.reading():
+        if shelf_files(INDEX_FILE) and (not len(address_book) or len(open_index(address_book.generation))):
+            return
+    with writing_index() as index:
+        if len(index) or not len(address_book):
+            return
+        for book_id, info in address_book.items():
+            index_add(index, book_id, info)
+        # Only the index was written, other processes still have to reopen it
+        address_book.changed = True
 
 address_book = load_address_book()
+prefixes = PrefixIndex(address_book, ['first_name', 'last_name', 'email_address'])
+ranges = {
+    'zip': RangeIndex(address_book, 'zip', zip_key),
+    'state': RangeIndex(address_book, 'state', state_key),
+    'birthday': RangeIndex(address_book, 'birthday', birthday_key),
+}
+build_index()
 
 # with shelve.open('address_book') as db:
 #     db['book_id'] = address_book
@@ -15,103 +129,131 @@ address_book = load_address_book()
 # with shelve.open('address_book') as db:
 #     loaded_book = db['book_id']
 
-def choice():
-    print("Address Book Menu:\n \
-1. Add New User\n \
-2. Search for Existing User\n \
-3. Change Existing User\n \
-4. Delete Existing User\n \
-5. Exit")
-    x = input("input: ")
-    if x == "1":
-        print("goto 1")
-        add()
-    elif x == "2":
-        print("goto 2")
-        search()
-    elif x == "3":
-        print("goto 3")
-        update()
-    elif x == "4":
-        print("goto 4")
-        delete()
-    else:
-        print("exit")
-
-def add():
-    print("Please input First Name:")
-    fname = input("Input: ")
-    print("Please input Last Name:")
-    lname = input("Input: ")
-    print("Please input Phone Number:")
-    num = input("Input: ")
-    print("Please input Email:")
-    ema = input("Input: ")
-
-    save(fname, lname, num, ema)
-    choice()
-
-def search():
-    inp1 = input("Please Input the first name: ")
-    inp2 = input("Please Input the last name: ")
-    for book_id, info in address_book.items():
-        if info["first_name"].lower() == inp1.lower() and info["last_name"].lower() == inp2.lower(): 
-            print(f"Found Address: {book_id}")
-            print(f"Address {info}")
-            return book_id
-    
-    print("No Address found.")
-    choice()
-    
-def update():
-    book_id = search()
-    print("What would you like to change")
-    x = input("input: ")
-    if x == "1":
-        print("name")
-        new_name = input("New Name: ")
-        address_book[book_id]["First Name"] = new_name
-    if x == "2":
-        print("lname")
-        new_lname = input("New Last Name: ")
-        address_book[book_id]["Last Name"] = new_lname
-    if x == "3":
-        print("phone")
-        new_phone = input("New Phone Number: ")
-        address_book[book_id]["Number"] = new_phone
-    if x == "4":
-        print("email")
-        new_email = input("New Email: ")
-        address_book[book_id]["Email"] = new_email
-    else:
-        print("exit")
-
-    save()
-
-    choice()
-
-def delete():
-    book_id = search()
-    inp1 = input(f"Are you sure you would like to delete {book_id}? (yes/no)")
-    if inp1 == "yes":
-        with shelve.open('address_book') as address_book:
-            del address_book[book_id]
-    elif inp1 == "no":
-        choice()
-    else:
-        print("Please type yes or no!")
-        delete()
-
-    save()
-    choice()
-
-def save(fname, lname, num, ema):
-    with shelve.open('address_book') as address_book:
-        book_id = f"{fname}_{lname}"
-        address_book[book_id] = {
-            'first_name': fname,
-            'last_name': lname,
-            'phone_number': num,
-            'email_address': ema
-    }
-choice()
\ No newline at end of file
+def close():
+    # Writes back pending edits, closes the book and compacts it if it is mostly dead space
+    global index
+    flush()
+    if index is not None:
+        index.close()
+        index = None
+    address_book.close()
+    if AUTO_COMPACT is not None:
+        if SHARDS > 1:
+            reclaimed = sum(compact(name, None, AUTO_COMPACT)[1] or 0 for name in address_book.filenames)
+        else:
+            reclaimed = compact('address_book', INDEX_FILE, AUTO_COMPACT)[1]
+        if reclaimed:
+            print(f"Compacted the address book, reclaimed {reclaimed} bytes")
+
+@metrics.timed('shelve', lambda book_id, info: 'update' if book_id in address_book else 'add')
+def save_record(book_id, info):
+    with writing_index() as index:
+        write_record(index, book_id, info)
+    return book_id
+
+@metrics.timed('shelve', 'flush')
+def flush():
+    # Writes back the records edited in place since they were read, under one lock
+    if not address_book.dirty:
+        return []
+    with writing_index() as index:
+        # Copied first, writing a record takes it out of dirty
+        edited = list(address_book.dirty.items())
+        for book_id, info in edited:
+            write_record(index, book_id, info)
+    return [book_id for book_id, _ in edited]
+
+@metrics.timed('shelve', 'update')
+def update_record(book_id, info):
+    # Edits the stored record in place, only the fields that differ, and
+    # writes it back with flush(). A record left as it was is not written
+    record = address_book[book_id]
+    for field in [field for field in record if field not in info]:
+        del record[field]
+    for field, value in info.items():
+        if record.get(field) != value:
+            record[field] = value
+    flush()
+    return book_id
+
+@metrics.timed('shelve', 'save_many')
+def save_many(records, ids=None):
+    # Saves several contacts under one lock and one open of the name index
+    given = ids
+    ids = []
+    with writing_index() as index:
+        for i, info in enumerate(records):
+            book_id = given[i] if given else f"{info['first_name']}_{info['last_name']}"
+            write_record(index, book_id, info)
+            ids.append(book_id)
+    return ids
+
+def stored(book_id):
+    # The record as it was last written, even if it has been edited in place since
+    info = address_book[book_id]
+    before = getattr(info, 'before', None)
+    return info if before is None else before
+
+@metrics.timed('shelve', 'write_record')
+def write_record(index, book_id, info):
+    # Drop the old name from the index first in case the name changed
+    if book_id in address_book:
+        old = stored(book_id)
+        index_remove(index, book_id, old)
+        prefixes.remove(book_id, old)
+        for by_field in ranges.values():
+            by_field.remove(book_id, old)
+    address_book[book_id] = info
+    if metrics.ENABLED:
+        # What the shelf pickles, before dbm pads it
+        metrics.written('shelve', 'write_record', len(pickle.dumps(dict(info), shelve.DEFAULT_PROTOCOL)))
+    index_add(index, book_id, info)
+    prefixes.add(book_id, info)
+    for by_field in ranges.values():
+        by_field.add(book_id, info)
+
+@metrics.timed('shelve', 'search')
+def find(fname, lname):
+    # Returns the ids of every contact with this name
+    key = name_key(fname, lname)
+    with address_book.reading():
+        results.check(address_book.generation)
+        ids = results.get(key)
+        if ids is None:
+            ids = open_index(address_book.generation).get(key, [])
+            results.put(key, ids)
+        return ids
+
+def prefix_search(prefix, k=10):
+    # Up to k ids whose name or email starts with prefix
+    with address_book.reading():
+        # Built again if another process wrote since it was built
+        prefixes.check(address_book.generation)
+        return prefixes.search(prefix, k)
+
+def range_search(field, low, high, limit=None):
+    # Ids with low <= key <= high for a field in ranges, in key order
+    with address_book.reading():
+        ranges[field].check(address_book.generation)
+        return ranges[field].range(low, high, limit=limit)
+
+def birthdays_soon(today=None):
+    with address_book.reading():
+        ranges['birthday'].check(address_book.generation)
+        return birthdays_this_week(ranges['birthday'], today)
+
+@metrics.timed('shelve', 'delete')
+def remove(book_id):
+    with writing_index() as index:
+        old = stored(book_id)
+        index_remove(index, book_id, old)
+        prefixes.remove(book_id, old)
+        for by_field in ranges.values():
+            by_field.remove(book_id, old)
+        del address_book[book_id]
+
+if __name__ == "__main__":
+    # The menu runs over this module, not a second import of it
+    from menu import choice
+    from storage import ShelveStore
+    choice(ShelveStore(sys.modules[__name__]))
@@ -0,0 +1,134 @@
+# OOP 4.2 Serialization with pickles
+# Snapshot encoding for book.pkl
+#
+# A snapshot starts with b"ABK5" and one byte naming the compression. The
+# rest, compressed or not, holds the out-of-band buffers (a uint32 count,
+# then a uint64 length and the bytes for each) followed by the pickle.
+# Older book.pkl files without the header are plain pickles and still load.
+#
+# Run this file to print write time, read time and size for every
+# protocol and compression on a synthetic book.
+#
+# Usage:
+#   python snapshot.py [contacts]
+
+import bz2
+import gzip
+import lzma
+import os
+import pickle
+import struct
+import sys
+import tempfile
+import time
+
+MAGIC = b"ABK5"
+COUNT = struct.Struct("<I")
+LENGTH = struct.Struct("<Q")
+
+# zlib is written with gzip framing so it can be streamed like the others
+COMPRESSION = {
+    None: (0, lambda f: f),
+    'zlib': (1, lambda f: gzip.GzipFile(fileobj=f, mode='wb', compresslevel=6)),
+    'lzma': (2, lambda f: lzma.LZMAFile(f, 'wb')),
+    'bz2': (3, lambda f: bz2.BZ2File(f, 'wb')),
+}
+READERS = {
+    0: lambda f: f,
+    1: lambda f: gzip.GzipFile(fileobj=f, mode='rb'),
+    2: lambda f: lzma.LZMAFile(f, 'rb'),
+    3: lambda f: bz2.BZ2File(f, 'rb'),
+}
+
+
+def write_snapshot(book, f, protocol=pickle.HIGHEST_PROTOCOL, compression=None):
+    code, wrap = COMPRESSION[compression]
+    buffers = []
+    # Protocol 5 hands large buffer objects to buffer_callback instead of
+    # copying them into the pickle, older protocols keep everything in band
+    callback = buffers.append if protocol >= 5 else None
+    data = pickle.dumps(book, protocol=protocol, buffer_callback=callback)
+    f.write(MAGIC + bytes([code]))
+    out = wrap(f)
+    out.write(COUNT.pack(len(buffers)))
+    for buffer in buffers:
+        raw = buffer.raw()
+        out.write(LENGTH.pack(raw.nbytes))
+        out.write(raw)
+    out.write(data)
+    if out is not f:
+        out.close()
+
+def read_snapshot(f):
+    if f.read(len(MAGIC)) != MAGIC:
+        f.seek(0)
+        return pickle.load(f)
+    stream = READERS[f.read(1)[0]](f)
+    (count,) = COUNT.unpack(stream.read(COUNT.size))
+    buffers = []
+    for _ in range(count):
+        (length,) = LENGTH.unpack(stream.read(LENGTH.size))
+        buffers.append(stream.read(length))
+    return pickle.load(stream, buffers=buffers)
+
+def replay_log(f, book):
+    """
+    Applies the journal entries in the open file f to book. Returns the
+    ids they touched and the offset just after the last whole entry. A
+    half written entry at the end is left as it is.
+    """
+    ids = []
+    good = f.tell()
+    while True:
+        try:
+            op, book_id, info = pickle.load(f)
+        except (EOFError, pickle.UnpicklingError):
+            break
+        if op == "set":
+            book[book_id] = info
+        else:
+            book.pop(book_id, None)
+        ids.append(book_id)
+        good = f.tell()
+    return ids, good
+
+def read_book(book_file='book.pkl', log_file='book.log'):
+    # The book as picklecrud loads it, without changing either file, so
+    # it can be read while a writer is appending to the log
+    book = {}
+    if os.path.exists(book_file):
+        with open(book_file, 'rb') as f:
+            book = read_snapshot(f)
+    if os.path.exists(log_file):
+        with open(log_file, 'rb') as f:
+            replay_log(f, book)
+    return book
+
+
+def benchmark(count=100000):
+    book = {f"book{i}": {"First Name": f"First{i}", "Last Name": f"Last{i % 500}",
+                         "Number": f"555-{i:07d}", "Email": f"user{i}@example.com"}
+            for i in range(1, count + 1)}
+    print(f"{count} contacts")
+    print(f"{'protocol':>8} {'compression':>11} {'write s':>8} {'read s':>8} {'size MB':>8}")
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, 'book.pkl')
+        for protocol in (pickle.DEFAULT_PROTOCOL, pickle.HIGHEST_PROTOCOL):
+            for compression in COMPRESSION:
+                start = time.perf_counter()
+                with open(path, 'wb') as f:
+                    write_snapshot(book, f, protocol, compression)
+                    f.flush()
+                    os.fsync(f.fileno())
+                written = time.perf_counter() - start
+
+                start = time.perf_counter()
+                with open(path, 'rb') as f:
+                    loaded = read_snapshot(f)
+                read = time.perf_counter() - start
+                assert loaded == book
+                size = os.path.getsize(path) / 1024 / 1024
+                print(f"{protocol:>8} {str(compression):>11} {written:>8.3f} {read:>8.3f} {size:>8.2f}")
+
+if __name__ == "__main__":
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
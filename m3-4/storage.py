@@ -0,0 +1,237 @@
+# OOP 4.2 Serialization with pickles
+# Address book stores behind one interface
+#
+# Every store has the same methods and uses the shelve field names
+# (first_name, last_name, phone_number, email_address, plus the optional
+# AddressBook fields), whatever it keeps on disk:
+#
+#   ids()                 every book id
+#   get(book_id)          one contact as a dict, None if it is not there
+#   find(first, last)     ids of the contacts with this name, any case
+#   put(book_id, info)    add or replace a contact, None picks a new id
+#   put_many(records, ids=None)
+#                         add several contacts in one write, returns their ids.
+#                         With ids they are stored under those, replacing any there
+#   remove(book_id)       delete a contact
+#   prefix(prefix, k)     up to k ids whose name or email starts with prefix
+#   generation()          a number that changes when another process writes
+#   close()               write everything out
+#
+# The shelve store also has range(field, low, high) over zip, state and
+# birthday, and birthdays_this_week().
+#
+# The store is picked by name from STORES. open_store() without a name uses
+# the ADDRESS_BOOK_STORE environment variable, then DEFAULT_STORE.
+
+import os
+import sqlite3
+
+import metrics
+from bulk import FIELDS, OPTIONAL_FIELDS, PICKLE_FIELDS, PICKLE_OPTIONAL_FIELDS
+from rangeindex import birthday_key, state_key, zip_key
+
+DEFAULT_STORE = 'shelve'
+SQLITE_FILE = 'address_book.db'
+
+COLUMNS = FIELDS + OPTIONAL_FIELDS
+
+# Fields the shelve store can answer range queries on
+RANGE_KEYS = {'zip': zip_key, 'state': state_key, 'birthday': birthday_key}
+
+
+def from_pickle(info):
+    # A picklecrud record under the shelve field names
+    record = {field: info.get(name, '') for name, field in PICKLE_FIELDS.items()}
+    record.update({field: info[name] for name, field in PICKLE_OPTIONAL_FIELDS.items() if name in info})
+    return record
+
+def to_pickle(info):
+    record = {name: info.get(field, '') for name, field in PICKLE_FIELDS.items()}
+    record.update({name: info[field] for name, field in PICKLE_OPTIONAL_FIELDS.items()
+                   if info.get(field) is not None})
+    return record
+
+
+class ShelveStore():
+    def __init__(self, crud=None):
+        if crud is None:
+            import shelvecrud as crud
+        self.crud = crud
+
+    def ids(self):
+        return list(self.crud.address_book)
+
+    def get(self, book_id):
+        return self.crud.address_book.get(book_id)
+
+    def find(self, first, last):
+        return self.crud.find(first, last)
+
+    def put(self, book_id, info):
+        # Edits go through the dirty tracking, only changed records are written
+        if book_id and book_id in self.crud.address_book:
+            return self.crud.update_record(book_id, info)
+        return self.crud.save_record(book_id or f"{info['first_name']}_{info['last_name']}", info)
+
+    def put_many(self, records, ids=None):
+        return self.crud.save_many(records, ids)
+
+    def remove(self, book_id):
+        self.crud.remove(book_id)
+
+    def prefix(self, prefix, k=10):
+        return self.crud.prefix_search(prefix, k)
+
+    def generation(self):
+        return self.crud.address_book.lock.generation()
+
+    def range(self, field, low, high, limit=100):
+        key = RANGE_KEYS[field]
+        return self.crud.range_search(field, key(low), key(high), limit)
+
+    def birthdays_this_week(self):
+        return self.crud.birthdays_soon()
+
+    def close(self):
+        self.crud.close()
+
+
+class PickleStore():
+    def __init__(self, crud=None):
+        if crud is None:
+            import picklecrud as crud
+        self.crud = crud
+
+    def ids(self):
+        return list(self.crud.book)
+
+    def get(self, book_id):
+        info = self.crud.book.get(book_id)
+        if info is None:
+            return None
+        return from_pickle(info)
+
+    def find(self, first, last):
+        return self.crud.find(first, last)
+
+    def put(self, book_id, info):
+        return self.crud.put(book_id or self.crud.new_id(), to_pickle(info))
+
+    def put_many(self, records, ids=None):
+        return self.crud.put_many([to_pickle(info) for info in records], ids)
+
+    def remove(self, book_id):
+        self.crud.remove(book_id)
+
+    def prefix(self, prefix, k=10):
+        return self.crud.prefixes.search(prefix, k)
+
+    def generation(self):
+        # The book is loaded once, writes by other processes are never seen
+        return 0
+
+    def close(self):
+        self.crud.checkpoint()
+
+
+class SqliteStore():
+    """
+    Contacts in one sqlite3 table, one column per field.
+
+    The database runs in WAL mode so readers in other processes are not
+    blocked by a writer. Names and email are indexed case-insensitively,
+    which is how find() compares them. Every statement is a constant string,
+    so sqlite3 prepares it once and reuses it from its statement cache.
+    put_many() inserts the whole batch in a single transaction.
+
+    Attributes:
+    filename: str -- the database file
+    db: sqlite3.Connection -- the open connection
+    """
+    SCHEMA = [
+        "CREATE TABLE IF NOT EXISTS contacts (book_id TEXT PRIMARY KEY, "
+        + ", ".join(f"{column} TEXT" for column in COLUMNS) + ")",
+        "CREATE INDEX IF NOT EXISTS contacts_name ON contacts "
+        "(first_name COLLATE NOCASE, last_name COLLATE NOCASE)",
+        "CREATE INDEX IF NOT EXISTS contacts_email ON contacts (email_address COLLATE NOCASE)",
+    ]
+    SELECT_IDS = "SELECT book_id FROM contacts"
+    SELECT = "SELECT " + ", ".join(COLUMNS) + " FROM contacts WHERE book_id = ?"
+    FIND = ("SELECT book_id FROM contacts WHERE first_name = ? COLLATE NOCASE "
+            "AND last_name = ? COLLATE NOCASE")
+    UPSERT = ("INSERT OR REPLACE INTO contacts (book_id, " + ", ".join(COLUMNS) + ") "
+              "VALUES (?" + ", ?" * len(COLUMNS) + ")")
+    DELETE = "DELETE FROM contacts WHERE book_id = ?"
+    PREFIX = ("SELECT book_id FROM contacts WHERE first_name LIKE ? ESCAPE '\\' "
+              "OR last_name LIKE ? ESCAPE '\\' OR email_address LIKE ? ESCAPE '\\' "
+              "ORDER BY book_id LIMIT ?")
+
+    def __init__(self, filename=SQLITE_FILE):
+        self.filename = filename
+        self.db = sqlite3.connect(filename)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        # With WAL a commit only has to reach the log, it is synced at checkpoints
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        with self.db:
+            for statement in self.SCHEMA:
+                self.db.execute(statement)
+
+    def _row(self, book_id, info):
+        return (book_id, *(info.get(column, '') if column in FIELDS else info.get(column)
+                           for column in COLUMNS))
+
+    def ids(self):
+        return [book_id for (book_id,) in self.db.execute(self.SELECT_IDS)]
+
+    def get(self, book_id):
+        row = self.db.execute(self.SELECT, (book_id,)).fetchone()
+        if row is None:
+            return None
+        # Optional fields are left out when they were never set, like in the shelf
+        return {column: value for column, value in zip(COLUMNS, row)
+                if column in FIELDS or value is not None}
+
+    @metrics.timed('sqlite', 'search')
+    def find(self, first, last):
+        return [book_id for (book_id,) in self.db.execute(self.FIND, (first, last))]
+
+    @metrics.timed('sqlite', lambda self, book_id, info: 'update' if book_id and self.get(book_id) else 'add')
+    def put(self, book_id, info):
+        book_id = book_id or f"{info['first_name']}_{info['last_name']}"
+        with self.db:
+            self.db.execute(self.UPSERT, self._row(book_id, info))
+        return book_id
+
+    @metrics.timed('sqlite', 'save_many')
+    def put_many(self, records, ids=None):
+        ids = ids or [f"{info['first_name']}_{info['last_name']}" for info in records]
+        with self.db:
+            self.db.executemany(self.UPSERT, (self._row(book_id, info) for book_id, info in zip(ids, records)))
+        return ids
+
+    @metrics.timed('sqlite', 'delete')
+    def remove(self, book_id):
+        with self.db:
+            self.db.execute(self.DELETE, (book_id,))
+
+    def prefix(self, prefix, k=10):
+        # LIKE ignores case, % and _ in the prefix are matched as they are
+        pattern = prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        return [book_id for (book_id,) in self.db.execute(self.PREFIX, (pattern, pattern, pattern, k))]
+
+    def generation(self):
+        # Moves when another connection commits
+        return self.db.execute("PRAGMA data_version").fetchone()[0]
+
+    def close(self):
+        self.db.close()
+
+
+STORES = {
+    'pickle': PickleStore,
+    'shelve': ShelveStore,
+    'sqlite': SqliteStore,
+}
+
+def open_store(name=None):
+    return STORES[name or os.environ.get('ADDRESS_BOOK_STORE') or DEFAULT_STORE]()
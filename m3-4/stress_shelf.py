@@ -0,0 +1,58 @@
+# OOP 4.2 Serialization with pickles
+# Hammers one shelf from a pool of processes and checks nothing was lost
+#
+# Usage:
+#   python stress_shelf.py [workers] [writes per worker]
+
+import os
+import random
+import sys
+import tempfile
+from multiprocessing import Pool
+
+from lazyshelf import LazyShelf
+
+
+def record(worker, i):
+    return {
+        'first_name': f"First{worker}",
+        'last_name': f"Last{i}",
+        'phone_number': f"555-{worker:03d}-{i:04d}",
+        'email_address': f"w{worker}.{i}@example.com",
+    }
+
+def work(args):
+    filename, worker, writes = args
+    reads = 0
+    with LazyShelf(filename, cache_size=64) as book:
+        for i in range(writes):
+            book[f"w{worker}_{i}"] = record(worker, i)
+            # Read back some of what any worker has written so far
+            for _ in range(3):
+                other = random.randrange(worker + 1)
+                key = f"w{other}_{random.randrange(i + 1)}"
+                if key in book:
+                    assert book[key] == record(other, int(key.split('_')[1]))
+                    reads += 1
+    return reads
+
+def main():
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    writes = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    with tempfile.TemporaryDirectory() as folder:
+        filename = os.path.join(folder, 'address_book')
+        LazyShelf(filename).close()
+        with Pool(workers) as pool:
+            reads = sum(pool.map(work, [(filename, w, writes) for w in range(workers)]))
+
+        with LazyShelf(filename) as book:
+            missing = [(w, i) for w in range(workers) for i in range(writes)
+                       if book.get(f"w{w}_{i}") != record(w, i)]
+            count = len(book)
+    print(f"{workers} workers, {workers * writes} writes, {reads} reads")
+    print(f"{count} records in the shelf, {len(missing)} missing or damaged")
+    if missing or count != workers * writes:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+# Tests for the versioned history of the pickle book: restoring any
+# version through bases and deltas, by number or by time, and pruning
+import itertools
+import pickle
+from types import SimpleNamespace
+
+import pytest
+
+import history
+
+ANN = {"First Name": "Ann", "Last Name": "Lee", "Number": "555-123-4567", "Email": "ann@example.com"}
+BO = {"First Name": "Bo", "Last Name": "Kim", "Number": "555-765-4321", "Email": "bo@example.com"}
+
+
+@pytest.fixture
+def folder(tmp_path, monkeypatch):
+    # A base every third version, so a few versions cover both kinds
+    monkeypatch.setattr(history, 'BASE_EVERY', 3)
+    # One second between versions, so restoring by time is never a tie
+    clock = itertools.count(1_000_000_000)
+    monkeypatch.setattr(history, 'time', SimpleNamespace(time=lambda: float(next(clock))))
+    return str(tmp_path / 'history')
+
+def save(book, changed, folder):
+    return history.record(book, changed, pickle.HIGHEST_PROTOCOL, None, folder)
+
+def build(folder):
+    # Every version of the book as it was saved, by version number
+    book, saved = {}, {}
+    steps = [("book1", ANN), ("book2", BO), ("book1", dict(ANN, Number="555-000-0000")),
+             ("book2", None), ("book3", BO)]
+    for book_id, info in steps:
+        if info is None:
+            del book[book_id]
+        else:
+            book[book_id] = info
+        saved[save(book, {book_id}, folder)] = dict(book)
+    return saved
+
+
+def test_restore_every_version(folder):
+    saved = build(folder)
+    kinds = [entry['kind'] for entry in history.versions(folder)]
+    assert kinds == ['base', 'delta', 'delta', 'base', 'delta']
+    for version, book in saved.items():
+        assert history.restore(version, folder=folder) == book
+    assert history.restore(folder=folder) == saved[max(saved)]
+
+def test_restore_at_time(folder):
+    saved = build(folder)
+    entries = history.versions(folder)
+    assert history.restore(at=entries[2]['time'], folder=folder) == saved[3]
+    with pytest.raises(KeyError):
+        history.restore(at=entries[0]['time'] - 1, folder=folder)
+
+def test_nothing_changed_is_not_a_version(folder):
+    build(folder)
+    assert save({"book1": ANN}, set(), folder) is None
+
+def test_prune_keeps_the_base_a_version_needs(folder):
+    saved = build(folder)
+    history.prune(keep_versions=1, folder=folder)
+    assert [entry['version'] for entry in history.versions(folder)] == [4, 5]
+    assert history.restore(5, folder=folder) == saved[5]
+    with pytest.raises(KeyError):
+        history.restore(1, folder=folder)
@@ -0,0 +1,66 @@
+# Tests for the picklecrud journal: book.log is replayed over book.pkl on
+# load, and a half written entry left by a crash is dropped
+import os
+import pickle
+import subprocess
+import sys
+
+from snapshot import read_book, replay_log
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+ANN = {"First Name": "Ann", "Last Name": "Lee", "Number": "555-123-4567", "Email": "ann@example.com"}
+BO = {"First Name": "Bo", "Last Name": "Kim", "Number": "555-765-4321", "Email": "bo@example.com"}
+
+
+def write_log(path, entries, torn=b""):
+    # Whole entries, then the start of one that never finished
+    with open(path, 'wb') as f:
+        for entry in entries:
+            pickle.dump(entry, f)
+        whole = f.tell()
+        f.write(torn)
+    return whole
+
+def torn_entry():
+    return pickle.dumps(("set", "book3", BO))[:-5]
+
+def run_picklecrud(folder, code):
+    # picklecrud loads the book from the working directory when imported
+    result = subprocess.run([sys.executable, '-c', 'import picklecrud\n' + code], cwd=folder,
+                            env={**os.environ, 'PYTHONPATH': HERE}, capture_output=True, text=True, check=True)
+    return result.stdout
+
+
+def test_replay_stops_before_torn_entry(tmp_path):
+    log = tmp_path / 'book.log'
+    whole = write_log(log, [("set", "book1", ANN), ("set", "book2", BO), ("del", "book1", None)], torn_entry())
+    book = {}
+    with open(log, 'rb') as f:
+        ids, good = replay_log(f, book)
+    assert ids == ["book1", "book2", "book1"]
+    assert good == whole
+    assert book == {"book2": BO}
+
+def test_read_book_leaves_files_alone(tmp_path):
+    with open(tmp_path / 'book.pkl', 'wb') as f:
+        pickle.dump({"book1": ANN}, f)
+    write_log(tmp_path / 'book.log', [("set", "book2", BO)], torn_entry())
+    size = os.path.getsize(tmp_path / 'book.log')
+    book = read_book(str(tmp_path / 'book.pkl'), str(tmp_path / 'book.log'))
+    assert book == {"book1": ANN, "book2": BO}
+    assert os.path.getsize(tmp_path / 'book.log') == size
+
+def test_load_cuts_torn_entry_and_appends_after_it(tmp_path):
+    with open(tmp_path / 'book.pkl', 'wb') as f:
+        pickle.dump({"book1": ANN}, f)
+    whole = write_log(tmp_path / 'book.log', [("set", "book2", BO)], torn_entry())
+
+    out = run_picklecrud(tmp_path, "print(sorted(picklecrud.book))")
+    assert out.split("\n")[0] == "['book1', 'book2']"
+    assert os.path.getsize(tmp_path / 'book.log') == whole
+
+    # A new entry follows the good ones and is read back on the next load
+    run_picklecrud(tmp_path, "picklecrud.put('book4', dict(picklecrud.book['book1'], Number='555-000-0000'))")
+    out = run_picklecrud(tmp_path, "print(sorted(picklecrud.book)); print(picklecrud.book['book4']['Number'])")
+    assert out.split("\n")[:2] == ["['book1', 'book2', 'book4']", "555-000-0000"]
@@ -0,0 +1,73 @@
+# Tests for resharding the shelve book: a run that dies while copying or
+# while swapping the new shards in is finished by running it again
+import os
+
+import pytest
+
+import shardedshelf
+from shardedshelf import ShardedShelf, open_book, reshard, staging_dir
+
+RECORDS = {f"Name{i}_Last{i}": {"first_name": f"Name{i}", "last_name": f"Last{i}",
+                                "phone_number": "555-123-4567", "email_address": f"n{i}@example.com"}
+           for i in range(50)}
+
+
+@pytest.fixture
+def filename(tmp_path):
+    filename = str(tmp_path / 'address_book')
+    book = ShardedShelf(filename, 2)
+    with book.writing():
+        for book_id, info in RECORDS.items():
+            book[book_id] = info
+    book.close()
+    return filename
+
+def contents(filename, count):
+    book = open_book(filename, count)
+    try:
+        return {book_id: dict(book[book_id]) for book_id in book}
+    finally:
+        book.close()
+
+class Crash(Exception):
+    pass
+
+
+def test_reshard_moves_everything(filename):
+    assert reshard(filename, 2, 3) == len(RECORDS)
+    assert contents(filename, 3) == RECORDS
+    # Nothing left to do the second time
+    assert reshard(filename, 2, 3) is None
+
+def test_rerun_after_crash_while_copying(filename, monkeypatch):
+    def crash(path):
+        raise Crash(path)
+    monkeypatch.setattr(shardedshelf, 'sync_path', crash)
+    with pytest.raises(Crash):
+        reshard(filename, 2, 3)
+    monkeypatch.undo()
+    # The old shards are untouched and the unfinished copy is started over
+    assert contents(filename, 2) == RECORDS
+    assert reshard(filename, 2, 3) == len(RECORDS)
+    assert contents(filename, 3) == RECORDS
+    assert not os.path.exists(staging_dir(filename))
+
+def test_rerun_after_crash_while_swapping(filename, monkeypatch):
+    finish = shardedshelf.finish_reshard
+
+    def crash_part_way(name):
+        # Moves one new shard file into place, then dies
+        staging = staging_dir(name)
+        moved = sorted(entry for entry in os.listdir(staging) if entry != shardedshelf.RESHARD_DONE)[0]
+        os.replace(os.path.join(staging, moved), os.path.join(os.path.dirname(name), moved))
+        raise Crash(moved)
+    monkeypatch.setattr(shardedshelf, 'finish_reshard', crash_part_way)
+    with pytest.raises(Crash):
+        reshard(filename, 2, 3)
+    monkeypatch.setattr(shardedshelf, 'finish_reshard', finish)
+    # The book cannot be opened half swapped
+    with pytest.raises(ValueError):
+        open_book(filename, 3)
+    assert reshard(filename, 2, 3) is None
+    assert contents(filename, 3) == RECORDS
+    assert not os.path.exists(staging_dir(filename))
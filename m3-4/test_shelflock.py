@@ -0,0 +1,61 @@
+# Tests for ShelfLock between processes. fcntl locks belong to a process,
+# so the other side of every test runs in a child process
+import multiprocessing
+
+import pytest
+
+from shelflock import LockTimeout, ShelfLock
+
+fork = multiprocessing.get_context('fork')
+
+
+def try_lock(path, kind, results):
+    # Reports whether the child got the lock within a short timeout
+    lock = ShelfLock(path, timeout=0.2)
+    try:
+        with getattr(lock, kind)():
+            results.put(True)
+    except LockTimeout:
+        results.put(False)
+    finally:
+        lock.close()
+
+def attempt(path, kind):
+    results = fork.Queue()
+    child = fork.Process(target=try_lock, args=(path, kind, results))
+    child.start()
+    got = results.get(timeout=10)
+    child.join()
+    return got
+
+@pytest.fixture
+def lock(tmp_path):
+    lock = ShelfLock(str(tmp_path / 'book.lock'), timeout=1.0)
+    yield lock
+    lock.close()
+
+
+def test_exclusive_keeps_other_processes_out(lock):
+    with lock.exclusive():
+        assert attempt(lock.path, 'exclusive') is False
+        assert attempt(lock.path, 'shared') is False
+    assert attempt(lock.path, 'exclusive') is True
+
+def test_readers_share_but_keep_writers_out(lock):
+    with lock.shared():
+        assert attempt(lock.path, 'shared') is True
+        assert attempt(lock.path, 'exclusive') is False
+    assert attempt(lock.path, 'exclusive') is True
+
+def bump_in_child(path):
+    lock = ShelfLock(path)
+    with lock.exclusive():
+        lock.bump()
+    lock.close()
+
+def test_generation_bumped_by_another_process(lock):
+    before = lock.generation()
+    child = fork.Process(target=bump_in_child, args=(lock.path,))
+    child.start()
+    child.join()
+    assert lock.generation() == before + 1